@@ -0,0 +1,130 @@
+"""
+Latency histograms and JSON run summaries for the netflow loader's
+benchmark mode (see `netflow_load_batch.py --benchmark`).
+"""
+import datetime
+import json
+import os
+import platform
+from importlib import metadata
+
+class LatencyHistogram:
+    """
+    HDR-style latency histogram.
+
+    Values are recorded in microseconds into log-linear buckets: every
+    power of two is split into 2**SUB_BUCKET_BITS linear buckets, so
+    percentiles are accurate to within 1% while memory only grows with the
+    number of distinct buckets hit. Histograms from several writers can be
+    combined with `merge`.
+    """
+    SUB_BUCKET_BITS = 7
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        """Record one latency, given in seconds."""
+        value = max(0, int(seconds * 1e6))
+        shift = max(0, value.bit_length() - self.SUB_BUCKET_BITS)
+        bucket = (value >> shift) << shift
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        """Add the values recorded in `other` to this histogram."""
+        for bucket, n in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """Return the `q`th percentile (0-100) in seconds."""
+        if not self.count:
+            return 0.0
+        target = q / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= target:
+                # Report the top of the bucket, as HdrHistogram does
+                shift = max(0, bucket.bit_length() - self.SUB_BUCKET_BITS)
+                return min(bucket + (1 << shift) - 1, self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        """Return count, mean and p50/p95/p99/max latencies in milliseconds."""
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count / 1e3 if self.count else 0.0,
+            'p50_ms': self.percentile(50) * 1e3,
+            'p95_ms': self.percentile(95) * 1e3,
+            'p99_ms': self.percentile(99) * 1e3,
+            'max_ms': self.max / 1e3,
+        }
+
+def format_latency(label, histogram):
+    s = histogram.summary()
+    return (f"{label}: p50 {s['p50_ms']:.1f}ms, p95 {s['p95_ms']:.1f}ms, "
+            f"p99 {s['p99_ms']:.1f}ms, max {s['max_ms']:.1f}ms ({s['count']} samples)")
+
+def run_summary(result):
+    """JSON-serializable view of a `stream` result."""
+    elapsed = result['elapsed']
+    summary = {
+        'rows': result['rows'],
+        'bytes': result['bytes'],
+        'elapsed_s': elapsed,
+        'rows_per_sec': result['rows'] / elapsed if elapsed > 0 else 0.0,
+        'mb_per_sec': result['bytes'] / elapsed / 1e6 if elapsed > 0 else 0.0,
+        'insert_latency': result['insert_latency'].summary(),
+        'commit_latency': result['commit_latency'].summary(),
+    }
+    if 'generate_wait' in result:
+        summary['generate_wait_s'] = result['generate_wait']
+    if 'batching' in result:
+        summary['batching'] = result['batching']
+    if 'writer' in result:
+        summary['writer'] = result['writer']
+    return summary
+
+def client_version():
+    try:
+        return metadata.version('vastdb')
+    except metadata.PackageNotFoundError:
+        return None
+
+def write_summary(directory, config, aggregate, writers=()):
+    """
+    Write a JSON summary of a benchmark run into `directory`.
+
+    Args:
+        directory (str): where to write the summary, created if missing
+        config (dict): the options the run was started with
+        aggregate (dict): `stream` result covering the whole run
+        writers (list[dict]): per-writer `stream` results, if any
+
+    Returns:
+        (str): path of the summary file
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = datetime.datetime.now()
+    path = os.path.join(directory, f"netflow-{started:%Y%m%dT%H%M%S}.json")
+    summary = {
+        'timestamp': started.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'vastdb_version': client_version(),
+        'config': config,
+        'aggregate': run_summary(aggregate),
+        'writers': [run_summary(r) for r in writers],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=4)
+    return path
@@ -1,16 +1,67 @@
+import argparse
+import contextlib
+import functools
+import multiprocessing
+import threading
+import numpy as np
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import vastdb
 import time
-import random
 import datetime
+import glob
 import os
+import queue
+import signal
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from netflow_benchmark import LatencyHistogram, format_latency, write_summary
+from netflow_scenarios import SUSPICIOUS_IPS, ScenarioEngine
+from netflow_traffic import AdaptiveBatchSize, FixedBatchSize, TrafficProfile
 
 hosts = [f"192.168.0.{i}" for i in range(1, 201)]
 external_ips = [f"10.0.{i}.{j}" for i in range(0,255) for j in range(1, 255)]  # Simulate external IPs
 protocols = ['TCP', 'UDP']
 ports = [80, 443, 22, 8080, 53]  # Common ports
 
+# src_ip and dst_ip are drawn as indices into one address table, hosts
+# first, so scenarios can use any address on either side of a flow.
+addresses = hosts + external_ips
+
+# Arrow dictionaries the generator indexes into, built once so that each
+# batch only has to draw integer indices and `take` from them.
+addresses_array = pa.array(addresses, pa.utf8())
+protocols_array = pa.array(protocols, pa.utf8())
+ports_array = np.array(ports, dtype=np.int32)
+
+def ipv4_to_int(ip):
+    a, b, c, d = (int(octet) for octet in ip.split('.'))
+    return (a << 24) | (b << 16) | (c << 8) | d
+
+# Integer equivalents for the 'integer' string encoding: IPv4 addresses as
+# unsigned 32 bit values and protocols as IANA protocol numbers.
+addresses_int = np.array([ipv4_to_int(ip) for ip in addresses], dtype=np.uint32)
+protocols_int = np.array([6, 17], dtype=np.int8)  # TCP, UDP
+
+# Rank of each address in the order its stored column sorts in: strings
+# lexicographically ('192.168.0.10' before '192.168.0.2'), integers
+# numerically. Sorting a batch by rank matches what min/max statistics see.
+address_rank = {
+    'utf8': np.argsort(np.argsort(np.array(addresses))),
+    'integer': np.argsort(np.argsort(addresses_int)),
+}
+address_rank['dictionary'] = address_rank['utf8']  # Decoded to strings before insert
+
+SORT_KEYS = {
+    'timestamp': ['timestamp'],
+    'timestamp,src_ip': ['timestamp', 'src_ip'],
+    'src_ip,timestamp': ['src_ip', 'timestamp'],
+}
+
+rng = np.random.default_rng()
+
 columns = pa.schema([
     ('timestamp', pa.timestamp('ms', tz=None)),
     ('src_ip', pa.utf8()),
@@ -23,49 +74,259 @@ columns = pa.schema([
     ('packets', pa.int64())
 ])
 
+# Same flows with src_ip, dst_ip and protocol as indices into a shared
+# dictionary. This only makes generating a batch cheaper: batches are decoded
+# to `columns` before they are inserted, so the table, the bytes sent and
+# the insert cost are the same as for 'utf8'.
+dictionary_columns = (columns
+    .set(1, pa.field('src_ip', pa.dictionary(pa.int32(), pa.utf8())))
+    .set(2, pa.field('dst_ip', pa.dictionary(pa.int32(), pa.utf8())))
+    .set(5, pa.field('protocol', pa.dictionary(pa.int8(), pa.utf8()))))
+
+# Compact layout for tables created with integer IPv4 and protocol columns.
+integer_columns = (columns
+    .set(1, pa.field('src_ip', pa.uint32()))
+    .set(2, pa.field('dst_ip', pa.uint32()))
+    .set(5, pa.field('protocol', pa.int8())))
+
+STRING_ENCODINGS = {
+    'utf8': columns,
+    'dictionary': dictionary_columns,
+    'integer': integer_columns,
+}
+
 def current_milli_time():
     return int(time.time() * 1000)
 
-def generate_flows():
-    current_time = current_milli_time()
-    netflow_ts = []
-    src_ip = []
-    dst_ip = []
-    src_port = []
-    dst_port = []
-    protocol = []
-    duration = []
-    bytes_sent = []
-    packets = []
-    for i in range(1, ( 3000 + random.randint(0,7000) ) ):
-        ms = current_time + random.randint(0,1000)
-        netflow_ts.append( datetime.datetime.fromtimestamp(ms / 1e3) )
-        src_ip.append( random.choice(hosts) )
-        dst_ip.append( random.choice(external_ips) )
-        src_port.append( random.randint(49152, 65535) )
-        dst_port.append( random.choice(ports) )
-        protocol.append( random.choice(protocols) )
-        duration.append( random.randint(200,1200) )
-        bytes_sent.append( random.randint(500, 5000) )
-        packets.append( random.randint(5, 50) )
-
-    flow_list = pa.Table.from_pydict(
-        dict(
-            zip(columns.names, (
-                netflow_ts,
-                src_ip,
-                dst_ip,
-                src_port,
-                dst_port,
-                protocol,
-                duration,
-                bytes_sent,
-                packets
-            ))
-        ), schema = columns
-    )
-
-    return flow_list
+def local_utc_offset_ms():
+    """Offset of local wall-clock time from UTC, in milliseconds.
+
+    Timestamps are stored as naive local time (as `datetime.fromtimestamp`
+    used to produce), so the offset is added to the epoch values.
+    """
+    offset = datetime.datetime.now().astimezone().utcoffset()
+    return int(offset.total_seconds() * 1000)
+
+def encode_strings(indices, values, values_int, encoding, index_type):
+    """Build an address/protocol column from dictionary indices."""
+    if encoding == 'dictionary':
+        return pa.DictionaryArray.from_arrays(pa.array(indices, type=index_type), values)
+    if encoding == 'integer':
+        return pa.array(values_int[indices])
+    return values.take(indices)
+
+def make_scenario(zipf=0.0, scan_rate=0.0, exfil_rate=0.0, ddos_rate=0.0):
+    """Build a ScenarioEngine over the generator's address table, or None if nothing is enabled."""
+    if not (zipf or scan_rate or exfil_rate or ddos_rate):
+        return None
+    suspicious = [addresses.index(ip) for ip in SUSPICIOUS_IPS]
+    return ScenarioEngine(len(hosts), len(external_ips), suspicious, zipf=zipf,
+                          scan_rate=scan_rate, exfil_rate=exfil_rate, ddos_rate=ddos_rate)
+
+def sort_flows(flows, sort_by, encoding):
+    """Reorder the column arrays in `flows` by the SORT_KEYS entry `sort_by`."""
+    keys = {'timestamp': flows['timestamp'], 'src_ip': address_rank[encoding][flows['src']]}
+    # lexsort sorts by its last key first
+    order = np.lexsort([keys[k] for k in reversed(SORT_KEYS[sort_by])])
+    return {name: values[order] for name, values in flows.items()}
+
+def generate_flows(num_rows=None, encoding='utf8', scenario=None, sort_by=None, time_bucket_ms=None):
+    """
+    Generate a batch of random flows as a pyarrow Table.
+
+    Every column is drawn with a single vectorized call and converted to
+    Arrow without materialising Python objects per row.
+
+    Args:
+        num_rows (int): number of flows to generate, defaults to a random
+            size between 3000 and 10000
+        encoding (str): how src_ip, dst_ip and protocol are represented,
+            one of STRING_ENCODINGS: 'utf8' strings, 'dictionary' encoded
+            strings or 'integer' IPv4 addresses and protocol numbers
+        scenario (ScenarioEngine): skews host selection and overlays
+            attack traffic, see `netflow_scenarios`; uniform if None
+        sort_by (str): SORT_KEYS entry to order the rows by, so each
+            insert covers narrow timestamp (or src_ip) ranges; random
+            order if None
+        time_bucket_ms (int): spread timestamps over the wall-clock
+            bucket of this many milliseconds the batch falls in, instead
+            of the second after the current time
+
+    Returns:
+        (pa.Table): flows matching the schema for `encoding`
+    """
+    if num_rows is None:
+        num_rows = int(rng.integers(3000, 10000))
+
+    current_time = current_milli_time() + local_utc_offset_ms()
+    if time_bucket_ms:
+        timestamps = current_time - current_time % time_bucket_ms + rng.integers(0, time_bucket_ms, num_rows,
+                                                                                dtype=np.int64)
+    else:
+        timestamps = current_time + rng.integers(0, 1001, num_rows, dtype=np.int64)
+
+    if scenario:
+        src = scenario.draw_hosts(rng, num_rows)
+        dst = scenario.draw_external(rng, num_rows)
+    else:
+        src = rng.integers(0, len(hosts), num_rows)
+        dst = len(hosts) + rng.integers(0, len(external_ips), num_rows)
+
+    flows = {
+        'timestamp': timestamps,
+        'src': src,
+        'dst': dst,
+        'src_port': rng.integers(49152, 65536, num_rows, dtype=np.int32),
+        'dst_port': ports_array[rng.integers(0, len(ports), num_rows)],
+        'protocol': rng.integers(0, len(protocols), num_rows),
+        'duration': rng.integers(200, 1201, num_rows, dtype=np.int64),
+        'bytes_sent': rng.integers(500, 5001, num_rows, dtype=np.int64),
+        'packets': rng.integers(5, 51, num_rows, dtype=np.int64),
+    }
+    if scenario:
+        scenario.apply(rng, flows)
+    if sort_by:
+        flows = sort_flows(flows, sort_by, encoding)
+
+    arrays = [
+        pa.array(flows['timestamp'], type=pa.timestamp('ms')),
+        encode_strings(flows['src'], addresses_array, addresses_int, encoding, pa.int32()),
+        encode_strings(flows['dst'], addresses_array, addresses_int, encoding, pa.int32()),
+        pa.array(flows['src_port']),
+        pa.array(flows['dst_port']),
+        encode_strings(flows['protocol'], protocols_array, protocols_int, encoding, pa.int8()),
+        pa.array(flows['duration']),
+        pa.array(flows['bytes_sent']),
+        pa.array(flows['packets']),
+    ]
+
+    return pa.Table.from_arrays(arrays, schema=STRING_ENCODINGS[encoding])
+
+def table_schema(encoding):
+    """Schema of the VastDB table that flows generated with `encoding` go into."""
+    return integer_columns if encoding == 'integer' else columns
+
+def decode_dictionaries(flows):
+    """Decode dictionary columns to their value type ahead of an insert."""
+    if any(pa.types.is_dictionary(t) for t in flows.schema.types):
+        return flows.cast(columns)
+    return flows
+
+def ipc_size(flows):
+    """Size of `flows` serialized as an Arrow IPC stream, as sent on the wire."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, flows.schema) as writer:
+        writer.write_table(flows)
+    return sink.getvalue().size
+
+def measure_encodings(num_rows):
+    """
+    Print bytes per row for each string encoding: in memory, serialized as
+    Arrow IPC, and for the src_ip, dst_ip and protocol columns alone.
+    Dictionary sizes are included, so small batches overstate their cost.
+    """
+    print(f"{'encoding':<12}{'memory bytes/row':>18}{'IPC bytes/row':>16}{'ip+protocol bytes/row':>24}")
+    for encoding in STRING_ENCODINGS:
+        flows = generate_flows(num_rows, encoding)
+        string_bytes = sum(flows.column(name).nbytes for name in ('src_ip', 'dst_ip', 'protocol'))
+        print(f"{encoding:<12}{flows.nbytes / num_rows:>18.1f}{ipc_size(flows) / num_rows:>16.1f}"
+              f"{string_bytes / num_rows:>24.1f}")
+
+CORPUS_FILE_BYTES = 1 << 30  # Size at which corpus files are rotated
+
+def write_corpus(directory, gigabytes, batch_rows, encoding='utf8', **options):
+    """
+    Pre-generate `gigabytes` of flows into Arrow IPC files for replay.
+
+    Each record batch holds `batch_rows` flows; files are rotated every
+    CORPUS_FILE_BYTES. Sizes are the bytes written to disk, so dictionary
+    encoded corpora, which store their dictionaries once per file, are not
+    cut short by counting a dictionary for every batch. The string encoding is stored in the schema metadata
+    so replay knows which table layout the corpus belongs to. Other
+    `options` (scenario, sort order) are passed to `generate_flows` and
+    carry over into replays.
+    """
+    os.makedirs(directory, exist_ok=True)
+    schema = STRING_ENCODINGS[encoding].with_metadata({'string_encoding': encoding})
+    target = int(gigabytes * (1 << 30))
+    written = file_bytes = file_index = 0
+    writer = None
+    start = time.monotonic()
+
+    while written < target:
+        if writer is None:
+            path = os.path.join(directory, f"flows-{file_index:04d}.arrow")
+            sink = pa.OSFile(path, 'wb')
+            writer = pa.ipc.new_file(sink, schema)
+            file_index += 1
+            file_bytes = 0
+        flows = generate_flows(batch_rows, encoding, **options)
+        writer.write_table(flows.replace_schema_metadata(schema.metadata))
+        written += sink.tell() - file_bytes
+        file_bytes = sink.tell()
+        if file_bytes >= CORPUS_FILE_BYTES:
+            writer.close()
+            sink.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+        sink.close()
+
+    print(f"Wrote {written / (1 << 30):.2f} GB of flows to {file_index} files in {directory} "
+          f"in {time.monotonic() - start:.1f}s")
+
+class CorpusReplay:
+    """
+    Replays a corpus written by `write_corpus` in place of `generate_flows`.
+
+    Files are memory-mapped and record batches sliced without copying; only
+    the timestamp column is rewritten so each batch starts at the current
+    time. The corpus is replayed from the start once exhausted.
+    """
+    def __init__(self, directory, paths=None):
+        self.directory = directory
+        self.paths = paths if paths is not None else sorted(glob.glob(os.path.join(directory, "*.arrow")))
+        if not self.paths:
+            raise FileNotFoundError(f"No .arrow corpus files found in {directory}")
+        self._batches = None
+
+    @property
+    def encoding(self):
+        with pa.memory_map(self.paths[0]) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        return metadata.get(b'string_encoding', b'utf8').decode()
+
+    def shard(self, index, count):
+        """Replay every `count`-th file starting at `index`, or all files if there are too few."""
+        if len(self.paths) < count:
+            return CorpusReplay(self.directory, self.paths)
+        return CorpusReplay(self.directory, self.paths[index::count])
+
+    def _iter_batches(self):
+        while True:
+            for path in self.paths:
+                reader = pa.ipc.open_file(pa.memory_map(path))
+                for i in range(reader.num_record_batches):
+                    yield reader.get_batch(i)
+
+    def __call__(self, num_rows=None):
+        # Opened lazily so instances can be pickled into writer processes
+        if self._batches is None:
+            self._batches = self._iter_batches()
+            self._batch, self._offset = next(self._batches), 0
+        if self._offset >= self._batch.num_rows:
+            self._batch, self._offset = next(self._batches), 0
+
+        length = self._batch.num_rows - self._offset
+        if num_rows is not None:
+            length = min(length, num_rows)
+        flows = pa.Table.from_batches([self._batch.slice(self._offset, length)])
+        self._offset += length
+
+        now = current_milli_time() + local_utc_offset_ms()
+        ts = flows.column('timestamp').cast(pa.int64())
+        shifted = pc.add(ts, now - pc.min(ts).as_py()).cast(pa.timestamp('ms'))
+        return flows.set_column(0, flows.schema.field('timestamp'), shifted)
 
 ######
 
@@ -77,24 +338,529 @@ VASTDB_NETFLOW_BUCKET = os.getenv("VASTDB_NETFLOW_BUCKET")
 VASTDB_NETFLOW_SCHEMA = os.getenv("VASTDB_NETFLOW_SCHEMA")
 VASTDB_NETFLOW_TABLE = os.getenv("VASTDB_NETFLOW_TABLE")
 
-if not VASTDB_ENDPOINT:
-    print("VASTDB_ENDPOINT env var not found.")
-    sys.exit(1)
-
 ######
 
-session = vastdb.connect(
-    endpoint=VASTDB_ENDPOINT,
-    access=VASTDB_ACCESS_KEY,
-    secret=VASTDB_SECRET_KEY
-    )
+class TokenBucket:
+    """
+    Token bucket used to pace inserts at a steady rows/sec rate.
+
+    Tokens accrue continuously at `rate` per second up to `capacity`;
+    `acquire` blocks until enough tokens are available for a batch. A
+    batch larger than `capacity` (e.g. grown by --adaptive, or during a
+    burst) leaves the bucket in deficit, so the rate holds for any batch
+    size.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = 0.0
+        self.last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def acquire(self, n):
+        """Block until `n` tokens are available, then consume them."""
+        self._refill()
+        # Consumed up front: the tokens accrued while sleeping pay off the
+        # deficit instead of being lost to the capacity limit
+        self.tokens -= n
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Generate random netflow data and insert it into VastDB.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Run continuously with one session instead of inserting a single round of batches")
+    parser.add_argument("--rate", type=int, default=2500,
+                        help="Target rows/sec in streaming mode, shared across writers; 0 for unthrottled (default: 2500)")
+    parser.add_argument("--batch-rows", type=int, default=5000,
+                        help="Rows per insert in streaming mode (default: 5000)")
+    parser.add_argument("--tx-batches", type=int, default=1,
+                        help="Inserts per transaction in streaming mode (default: 1)")
+    parser.add_argument("--writers", type=int, default=1,
+                        help="Number of writer processes in streaming mode, each with its own session (default: 1)")
+    parser.add_argument("--pipeline-depth", type=int, default=None,
+                        help="Batches generated ahead on a background thread while inserts are in flight; "
+                             "0 generates and inserts serially. Batch sizes are chosen this many batches ahead, "
+                             "so --adaptive reacts that much later (default: 2, or 1 with --adaptive)")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="Stop streaming after this many seconds (default: run until interrupted)")
+    parser.add_argument("--report-interval", type=float, default=10.0,
+                        help="Seconds between rate reports in streaming mode (default: 10)")
+    parser.add_argument("--adaptive", choices=['latency', 'throughput'],
+                        help="Adapt the batch size, starting at --batch-rows, with an AIMD controller that either "
+                             "keeps insert latency under --target-latency-ms or maximises rows/sec")
+    parser.add_argument("--target-latency-ms", type=float, default=500.0,
+                        help="Insert latency to aim for with --adaptive latency (default: 500)")
+    parser.add_argument("--min-batch-rows", type=int, default=1000,
+                        help="Smallest batch --adaptive may use (default: 1000)")
+    parser.add_argument("--max-batch-rows", type=int, default=1000000,
+                        help="Largest batch --adaptive may use (default: 1000000)")
+    parser.add_argument("--profile", choices=['diurnal', 'bursty'],
+                        help="Vary the rate over time around --rate instead of using fixed-size batches: a daily "
+                             "'diurnal' cycle, or 'bursty' traffic with random 5x bursts")
+    parser.add_argument("--profile-period", type=float, default=86400.0,
+                        help="Length in seconds of the diurnal cycle, shorten it to compress a day (default: 86400)")
+    parser.add_argument("--flush-interval", type=float, default=1.0,
+                        help="Seconds of traffic per insert with --profile (default: 1)")
+    parser.add_argument("--string-encoding", choices=STRING_ENCODINGS, default='utf8',
+                        help="Representation of src_ip, dst_ip and protocol: 'utf8' strings, 'dictionary' "
+                             "encoded strings, which only speeds up generation as they are decoded to strings "
+                             "before insert, or 'integer' IPv4/protocol numbers, which are also sent and stored "
+                             "as integers and need a table created with integer columns (default: utf8)")
+    parser.add_argument("--zipf", type=float, default=0.0,
+                        help="Zipf exponent for how often each host and external address appears, e.g. 1.1 for "
+                             "a few very busy hosts; 0 for uniform (default: 0)")
+    parser.add_argument("--scan-rate", type=float, default=0.0,
+                        help="Fraction of flows that are port scans: bursts from one host walking sequential "
+                             "ports on a suspicious address (default: 0)")
+    parser.add_argument("--exfil-rate", type=float, default=0.0,
+                        help="Fraction of flows that are exfiltration: long, multi-megabyte transfers from one "
+                             "host to a suspicious address (default: 0)")
+    parser.add_argument("--ddos-rate", type=float, default=0.0,
+                        help="Fraction of flows that are DDoS fan-in: small flows from many external addresses "
+                             "to a single host (default: 0)")
+    parser.add_argument("--sort-by", choices=SORT_KEYS,
+                        help="Sort the rows of each batch so inserts cover narrow timestamp (or src_ip) ranges "
+                             "that time-window queries can prune on (default: random order)")
+    parser.add_argument("--time-bucket-ms", type=int, default=None,
+                        help="Align each batch to the wall-clock bucket of this many milliseconds it falls in, "
+                             "e.g. 60000 for one-minute buckets (default: the second after the batch is generated)")
+    parser.add_argument("--generate-corpus", metavar="DIR",
+                        help="Pre-generate flows into Arrow IPC files in DIR and exit, without connecting to VastDB")
+    parser.add_argument("--corpus-gb", type=float, default=1.0,
+                        help="Gigabytes of flows to pre-generate with --generate-corpus (default: 1)")
+    parser.add_argument("--replay", metavar="DIR",
+                        help="Insert flows replayed from a corpus in DIR instead of generating them")
+    parser.add_argument("--sink", choices=['vastdb', 'parquet'], default='vastdb',
+                        help="Where flows are written: the VastDB table, or local Parquet files as a stand-in "
+                             "for exercising the loader without a cluster (default: vastdb)")
+    parser.add_argument("--sink-dir", default="netflow-parquet",
+                        help="Directory for --sink parquet, one file per transaction (default: netflow-parquet)")
+    parser.add_argument("--benchmark", metavar="DIR",
+                        help="Write a JSON summary of the run, including insert and commit latency "
+                             "percentiles, into DIR")
+    parser.add_argument("--measure-encodings", action="store_true",
+                        help="Print bytes per row for each string encoding and exit, without connecting to VastDB")
+    args = parser.parse_args()
+    if args.rate < 0:
+        parser.error("--rate must not be negative")
+    if args.batch_rows <= 0 or args.tx_batches <= 0 or args.writers <= 0:
+        parser.error("--batch-rows, --tx-batches and --writers must be positive")
+    if args.pipeline_depth is None:
+        args.pipeline_depth = 1 if args.adaptive else 2
+    if args.pipeline_depth < 0:
+        parser.error("--pipeline-depth must not be negative")
+    if args.writers > 1 and not args.stream:
+        parser.error("--writers requires --stream")
+    if args.benchmark and not args.stream:
+        parser.error("--benchmark requires --stream")
+    if (args.adaptive or args.profile) and not args.stream:
+        parser.error("--adaptive and --profile require --stream")
+    if args.adaptive and args.profile:
+        parser.error("--adaptive and --profile are mutually exclusive")
+    if args.profile and not args.rate:
+        parser.error("--profile requires a non-zero --rate")
+    if args.zipf < 0:
+        parser.error("--zipf must not be negative")
+    scenario_rates = [args.scan_rate, args.exfil_rate, args.ddos_rate]
+    if min(scenario_rates) < 0 or sum(scenario_rates) > 1:
+        parser.error("--scan-rate, --exfil-rate and --ddos-rate must not be negative and must add up to at most 1")
+    if args.time_bucket_ms is not None and args.time_bucket_ms <= 0:
+        parser.error("--time-bucket-ms must be positive")
+    if args.replay and (args.zipf or any(scenario_rates) or args.sort_by or args.time_bucket_ms):
+        parser.error("scenarios and --sort-by are applied when a corpus is generated, and replayed batches "
+                     "always start at the current time, so they can't be combined with --replay")
+    return args
+
+def get_session():
+    """Connect to VastDB using the VASTDB_* environment variables."""
+    if not VASTDB_ENDPOINT:
+        print("VASTDB_ENDPOINT env var not found.")
+        sys.exit(1)
+
+    return vastdb.connect(
+        endpoint=VASTDB_ENDPOINT,
+        access=VASTDB_ACCESS_KEY,
+        secret=VASTDB_SECRET_KEY
+        )
+
+def create_table(session, table_columns=columns):
+    """
+    Create the netflow schema and table if they don't already exist, and
+    check that an existing table has the expected column types.
+    """
+    with session.transaction() as tx:
+        bucket = tx.bucket(VASTDB_NETFLOW_BUCKET)
+        schema = bucket.create_schema(VASTDB_NETFLOW_SCHEMA, fail_if_exists=False)
+        table = schema.create_table(VASTDB_NETFLOW_TABLE, table_columns, fail_if_exists=False)
+        src_ip_type = table.arrow_schema.field('src_ip').type
+        if src_ip_type != table_columns.field('src_ip').type:
+            print(f"Table {VASTDB_NETFLOW_TABLE} has src_ip of type {src_ip_type}, expected "
+                  f"{table_columns.field('src_ip').type}. Use a different VASTDB_NETFLOW_TABLE "
+                  f"for this string encoding.")
+            sys.exit(1)
+
+def get_table(tx):
+    """Return the netflow table within an open transaction."""
+    return tx.bucket(VASTDB_NETFLOW_BUCKET).schema(VASTDB_NETFLOW_SCHEMA).table(VASTDB_NETFLOW_TABLE)
+
+class VastDBSink:
+    """Writes flows into the netflow table over a VastDB session."""
+    def __init__(self, session=None):
+        self.session = session or get_session()
+
+    def create_table(self, table_columns):
+        create_table(self.session, table_columns)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Yield the table within a transaction, committed on exit."""
+        with self.session.transaction() as tx:
+            yield get_table(tx)
+
+class ParquetTable:
+    def __init__(self, writer):
+        self.writer = writer
+
+    def insert(self, flows):
+        self.writer.write_table(flows)
+
+class ParquetSink:
+    """
+    Local stand-in for VastDB that writes each transaction to its own
+    Parquet file, so the loader and benchmark can run without a cluster.
+    """
+    def __init__(self, directory, prefix="flows"):
+        self.directory = directory
+        self.prefix = f"{prefix}-{os.getpid()}"
+        self.sequence = 0
+        self.schema = columns
+
+    def create_table(self, table_columns):
+        os.makedirs(self.directory, exist_ok=True)
+        self.schema = table_columns
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Yield a table writing to a new Parquet file, closed on exit."""
+        path = os.path.join(self.directory, f"{self.prefix}-{self.sequence:06d}.parquet")
+        self.sequence += 1
+        with pq.ParquetWriter(path, self.schema) as writer:
+            yield ParquetTable(writer)
+
+def open_sink(kind, directory, table_columns=columns, writer_id=None):
+    """
+    Open the sink selected with --sink and create its table if needed.
+    Pool writers each open their own sink.
+    """
+    if kind == 'parquet':
+        sink = ParquetSink(directory, "flows" if writer_id is None else f"writer{writer_id}")
+    else:
+        sink = VastDBSink()
+    sink.create_table(table_columns)
+    return sink
+
+def insert_batches(sink, generate=generate_flows):
+    """Insert one round of randomly sized batches in a single transaction."""
+    with sink.transaction() as table:
+        for m in range(1,5):
+            table.insert( decode_dictionaries(generate()) )
+
+def report_rate(label, rows, nbytes, elapsed, target, detail=""):
+    achieved = rows / elapsed if elapsed > 0 else 0.0
+    mb_per_sec = nbytes / elapsed / 1e6 if elapsed > 0 else 0.0
+    line = f"{label}: {rows} rows in {elapsed:.1f}s, achieved {achieved:,.0f} rows/sec, {mb_per_sec:,.1f} MB/sec"
+    if target:
+        line += f", target {target:,.0f} rows/sec ({achieved / target:.1%})"
+    if detail:
+        line += f", {detail}"
+    print(line, flush=True)
+
+def report_latency(label, result):
+    print(format_latency(f"{label}insert latency", result['insert_latency']))
+    print(format_latency(f"{label}commit latency", result['commit_latency']), flush=True)
+
+# Set by SIGINT/SIGTERM to stop streaming after the in-flight transaction.
+stop_event = threading.Event()
+
+class Prefetcher:
+    """
+    Generates batches on a background thread, ahead of the inserts.
+
+    The consumer chooses the size of each batch and `request`s it; the
+    background thread calls `generate(num_rows)` for each request in turn
+    and `get` returns the batches in request order. Batch sizers are only
+    used on the consumer's thread, and keeping requests outstanding
+    lets the next batches be generated while an insert is in
+    flight. Exceptions raised by `generate` are re-raised by `get`.
+    `close` stops the background thread.
+    """
+    def __init__(self, generate):
+        self.generate = generate
+        self.sizes = queue.Queue()
+        self.ready = queue.Queue()
+        self.done = threading.Event()
+        self.producer = threading.Thread(target=self._produce, name="flow-generator", daemon=True)
+        self.producer.start()
+
+    def _produce(self):
+        try:
+            while True:
+                num_rows = self.sizes.get()
+                if num_rows is None or self.done.is_set():
+                    return
+                self.ready.put((self.generate(num_rows), None))
+        except Exception as e:
+            self.ready.put((None, e))
+
+    def request(self, num_rows):
+        self.sizes.put(num_rows)
+
+    def get(self):
+        batch, error = self.ready.get()
+        if error is not None:
+            raise error
+        return batch
+
+    def close(self):
+        self.done.set()
+        self.sizes.put(None)
+
+def stream(sink, generate, rate, batch_rows, tx_batches=1, duration=None, report_interval=10.0, label="",
+           batch_sizer=FixedBatchSize, pipeline_depth=2):
+    """
+    Insert batches continuously into `sink`, paced to `rate` rows/sec.
+
+    Each transaction inserts `tx_batches` batches of flows from `generate`,
+    which takes the number of rows to produce. Batch sizes and pacing come
+    from `batch_sizer(rate, batch_rows)`, one of the `netflow_traffic`
+    sizers; by default every batch has `batch_rows` rows. A `rate` of 0
+    disables pacing. With a `pipeline_depth` above 0, up to that many
+    batches are generated ahead on a background thread while inserts are
+    in flight; 0 generates and inserts serially. Achieved vs. target rate is
+    printed every `report_interval` seconds, and rate and latencies once
+    more on exit. The size of each generated batch is chosen when the
+    batch `pipeline_depth` inserts ahead of it is taken, so an adaptive
+    sizer's decisions apply `pipeline_depth` batches later.
+
+    Returns:
+        (dict): rows, bytes and elapsed seconds for the run, insert and
+            commit latency histograms, a summary of the batch sizing and
+            the seconds spent waiting for generated batches
+    """
+    sizer = batch_sizer(rate, batch_rows)
+
+    def generate_batch(num_rows):
+        return decode_dictionaries(generate(num_rows))
+
+    if pipeline_depth:
+        prefetcher = Prefetcher(generate_batch)
+        for _ in range(pipeline_depth):
+            prefetcher.request(sizer.next_size())
+
+        def next_batch():
+            flows = prefetcher.get()
+            prefetcher.request(sizer.next_size())
+            return flows
+    else:
+        prefetcher = None
+
+        def next_batch():
+            return generate_batch(sizer.next_size())
+
+    generate_wait = 0.0
+    bucket = TokenBucket(rate, capacity=max(rate, batch_rows)) if rate else None
+    insert_latency = LatencyHistogram()
+    commit_latency = LatencyHistogram()
+    start = last_report = time.monotonic()
+    total_rows = total_bytes = interval_rows = interval_bytes = 0
+
+    def running():
+        if stop_event.is_set():
+            return False
+        return duration is None or time.monotonic() - start < duration
+
+    try:
+        while running():
+            with sink.transaction() as table:
+                for _ in range(tx_batches):
+                    wait_start = time.monotonic()
+                    flows = next_batch()
+                    generate_wait += time.monotonic() - wait_start
+                    if bucket:
+                        bucket.rate = sizer.current_rate()
+                        bucket.acquire(flows.num_rows)
+                    insert_start = time.monotonic()
+                    table.insert(flows)
+                    latency = time.monotonic() - insert_start
+                    insert_latency.record(latency)
+                    sizer.observe(flows.num_rows, latency)
+                    interval_rows += flows.num_rows
+                    interval_bytes += flows.nbytes
+                    if not running():
+                        break
+                commit_start = time.monotonic()
+            commit_latency.record(time.monotonic() - commit_start)
+
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                report_rate(f"{label}interval", interval_rows, interval_bytes, now - last_report, rate,
+                            sizer.describe())
+                total_rows += interval_rows
+                total_bytes += interval_bytes
+                last_report = now
+                interval_rows = interval_bytes = 0
+    finally:
+        if prefetcher:
+            prefetcher.close()
+    total_rows += interval_rows
+    total_bytes += interval_bytes
+    elapsed = time.monotonic() - start
+    result = {
+        'rows': total_rows,
+        'bytes': total_bytes,
+        'elapsed': elapsed,
+        'insert_latency': insert_latency,
+        'commit_latency': commit_latency,
+        'batching': sizer.summary(),
+        'generate_wait': generate_wait,
+    }
+    report_rate(f"{label}total", total_rows, total_bytes, elapsed, rate, sizer.describe())
+    report_latency(label, result)
+    print(f"{label}waited {generate_wait:.1f}s ({generate_wait / elapsed:.0%} of the run) for generated batches",
+          flush=True)
+    return result
+
+def init_writer(event):
+    """Process pool initializer: share the stop event and reseed the generator."""
+    global stop_event, rng
+    # The parent handles SIGINT/SIGTERM and sets the event for all writers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    stop_event = event
+    # Forked workers would otherwise share the parent's random state
+    rng = np.random.default_rng()
+
+def run_writer(writer_id, writers, sink_factory, generate, rate, batch_rows, tx_batches, duration, report_interval,
+               batch_sizer, pipeline_depth):
+    """Stream flows from a pool worker into its own sink (and VastDB session)."""
+    sink = sink_factory(writer_id=writer_id)
+    if isinstance(generate, CorpusReplay):
+        generate = generate.shard(writer_id, writers)
+    result = stream(sink, generate, rate, batch_rows, tx_batches, duration, report_interval,
+                    label=f"writer {writer_id} ", batch_sizer=batch_sizer, pipeline_depth=pipeline_depth)
+    result['writer'] = writer_id
+    return result
+
+def stream_parallel(writers, sink_factory, generate, rate, batch_rows, tx_batches=1, duration=None,
+                    report_interval=10.0, batch_sizer=FixedBatchSize, pipeline_depth=2):
+    """
+    Stream flows from `writers` processes, each with its own sink from
+    `sink_factory`, splitting `rate` evenly between them. Per-writer and
+    aggregate throughput and latencies are printed once all writers have
+    stopped.
+
+    Returns:
+        (dict, list[dict]): the aggregate result and per-writer results
+    """
+    event = multiprocessing.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: event.set())
+
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=writers, initializer=init_writer, initargs=(event,)) as pool:
+        futures = [
+            pool.submit(run_writer, n, writers, sink_factory, generate, rate / writers, batch_rows, tx_batches,
+                        duration, report_interval, batch_sizer, pipeline_depth)
+            for n in range(writers)
+        ]
+        results = [f.result() for f in futures]
+    elapsed = time.monotonic() - start
+
+    aggregate = {
+        'rows': sum(r['rows'] for r in results),
+        'bytes': sum(r['bytes'] for r in results),
+        'elapsed': elapsed,
+        'insert_latency': LatencyHistogram(),
+        'commit_latency': LatencyHistogram(),
+    }
+    for r in results:
+        aggregate['insert_latency'].merge(r['insert_latency'])
+        aggregate['commit_latency'].merge(r['commit_latency'])
+
+    print(f"--- {writers} writers, {batch_rows} rows/insert, {tx_batches} inserts/transaction ---")
+    for r in sorted(results, key=lambda r: r['writer']):
+        report_rate(f"writer {r['writer']}", r['rows'], r['bytes'], r['elapsed'], rate / writers,
+                    ", ".join(f"{k} {v:,.0f}" if isinstance(v, float) else f"{k} {v}"
+                              for k, v in r['batching'].items() if k != 'mode'))
+    report_rate("aggregate", aggregate['rows'], aggregate['bytes'], elapsed, rate)
+    report_latency("aggregate ", aggregate)
+    return aggregate, results
+
+def handle_stop(signum, frame):
+    stop_event.set()
+
+def main():
+    args = parse_arguments()
+
+    if args.measure_encodings:
+        measure_encodings(args.batch_rows)
+        return
+
+    options = {
+        'scenario': make_scenario(args.zipf, args.scan_rate, args.exfil_rate, args.ddos_rate),
+        'sort_by': args.sort_by,
+        'time_bucket_ms': args.time_bucket_ms,
+    }
+
+    if args.generate_corpus:
+        write_corpus(args.generate_corpus, args.corpus_gb, args.batch_rows, args.string_encoding, **options)
+        return
+
+    if args.replay:
+        generate = CorpusReplay(args.replay)
+        encoding = generate.encoding
+    else:
+        generate = functools.partial(generate_flows, encoding=args.string_encoding, **options)
+        encoding = args.string_encoding
+
+    if args.adaptive:
+        batch_sizer = functools.partial(AdaptiveBatchSize, target=args.adaptive,
+                                        target_latency=args.target_latency_ms / 1000,
+                                        min_rows=args.min_batch_rows, max_rows=args.max_batch_rows)
+    elif args.profile:
+        batch_sizer = functools.partial(TrafficProfile, profile=args.profile, flush_interval=args.flush_interval,
+                                        period=args.profile_period)
+    else:
+        batch_sizer = FixedBatchSize
+
+    table_columns = table_schema(encoding)
+    sink = open_sink(args.sink, args.sink_dir, table_columns)
 
-with session.transaction() as tx:
-    bucket = tx.bucket(VASTDB_NETFLOW_BUCKET)
-    schema = bucket.create_schema(VASTDB_NETFLOW_SCHEMA, fail_if_exists=False)
-    table = schema.create_table(VASTDB_NETFLOW_TABLE, columns, fail_if_exists=False)
+    if args.stream and args.writers > 1:
+        sink_factory = functools.partial(open_sink, args.sink, args.sink_dir, table_columns)
+        aggregate, writers = stream_parallel(args.writers, sink_factory, generate, args.rate, args.batch_rows,
+                                             args.tx_batches, args.duration, args.report_interval, batch_sizer,
+                                             args.pipeline_depth)
+    elif args.stream:
+        signal.signal(signal.SIGINT, handle_stop)
+        signal.signal(signal.SIGTERM, handle_stop)
+        aggregate = stream(sink, generate, args.rate, args.batch_rows, args.tx_batches,
+                           args.duration, args.report_interval, batch_sizer=batch_sizer,
+                           pipeline_depth=args.pipeline_depth)
+        writers = []
+    else:
+        insert_batches(sink, generate)
+        return
 
-    for m in range(1,5):
-        table.insert( generate_flows() )
+    if args.benchmark:
+        path = write_summary(args.benchmark, vars(args), aggregate, writers)
+        print(f"Benchmark summary written to {path}")
 
-    #time.sleep(9.700)
+if __name__ == "__main__":
+    main()
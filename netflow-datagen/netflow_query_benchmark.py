@@ -0,0 +1,148 @@
+"""
+Measure the latency of the Infosec saved query against the netflow table
+through Trino, to compare ingest orderings (see `netflow_load_batch.py
+--sort-by` and `--time-bucket-ms`).
+
+With DOCKER_HOST_OR_IP and the VASTDB_NETFLOW_* variables from
+.env-local exported, load the table with one ordering while this runs,
+then repeat with another and compare the summaries:
+
+    ./start.sh --rate 50000 &
+    python3 netflow_query_benchmark.py --label random --output bench
+    ./start.sh --rate 50000 --sort-by timestamp --time-bucket-ms 1000 &
+    python3 netflow_query_benchmark.py --label sorted --output bench
+
+Besides client-side latency, Trino's own elapsed time and the rows and
+bytes it read are reported: rows read falling relative to the table size
+is the pruning that sorted inserts are meant to enable.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import trino
+
+from netflow_benchmark import LatencyHistogram, format_latency
+
+DOCKER_HOST_OR_IP = os.getenv("DOCKER_HOST_OR_IP")
+
+VASTDB_NETFLOW_BUCKET = os.getenv("VASTDB_NETFLOW_BUCKET")
+VASTDB_NETFLOW_SCHEMA = os.getenv("VASTDB_NETFLOW_SCHEMA")
+VASTDB_NETFLOW_TABLE = os.getenv("VASTDB_NETFLOW_TABLE")
+
+# The second statement of the 'Infosec Queries' saved query
+QUERY = """
+SELECT timestamp, src_ip, dst_ip, protocol, src_port, dst_port, duration, bytes_sent, packets
+FROM "{bucket}|{schema}".{table}
+WHERE timestamp BETWEEN (now() - INTERVAL '{window}' MINUTE) AND now()
+ORDER BY timestamp DESC
+LIMIT {limit}
+"""
+
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the Infosec time-window query on the netflow table.")
+    parser.add_argument("--host", default=DOCKER_HOST_OR_IP,
+                        help="Trino host (default: $DOCKER_HOST_OR_IP)")
+    parser.add_argument("--port", type=int, default=8443,
+                        help="Trino HTTPS port (default: 8443)")
+    parser.add_argument("--user", default="admin",
+                        help="Trino user (default: admin)")
+    parser.add_argument("--runs", type=int, default=20,
+                        help="Timed executions of the query (default: 20)")
+    parser.add_argument("--warmup", type=int, default=2,
+                        help="Untimed executions before the timed runs (default: 2)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="Seconds between executions, so the window moves over freshly inserted rows (default: 1)")
+    parser.add_argument("--window-minutes", type=int, default=1,
+                        help="Size of the timestamp window in minutes (default: 1, as in the saved query)")
+    parser.add_argument("--limit", type=int, default=10,
+                        help="LIMIT of the query (default: 10, as in the saved query)")
+    parser.add_argument("--label", default="",
+                        help="Name for this run in the summary, e.g. the ingest ordering being measured")
+    parser.add_argument("--output", metavar="DIR",
+                        help="Write a JSON summary of the run into DIR")
+    args = parser.parse_args()
+    if not args.host:
+        parser.error("--host or DOCKER_HOST_OR_IP is required")
+    if args.runs <= 0 or args.warmup < 0:
+        parser.error("--runs must be positive and --warmup must not be negative")
+    return args
+
+def connect(host, port, user):
+    """Connect to Trino's vast catalog, as the Superset 'Trino VastDB' database does."""
+    return trino.dbapi.connect(host=host, port=port, user=user, catalog='vast', http_scheme='https', verify=False)
+
+def run_query(cursor, sql):
+    """
+    Execute `sql` and fetch every row.
+
+    Returns:
+        (float, dict): client-side latency in seconds and Trino's query stats
+    """
+    start = time.monotonic()
+    cursor.execute(sql)
+    cursor.fetchall()
+    return time.monotonic() - start, cursor.stats
+
+def table_rows(cursor):
+    cursor.execute(f'SELECT count(*) FROM "{VASTDB_NETFLOW_BUCKET}|{VASTDB_NETFLOW_SCHEMA}".{VASTDB_NETFLOW_TABLE}')
+    return cursor.fetchall()[0][0]
+
+def main():
+    args = parse_arguments()
+    if not (VASTDB_NETFLOW_BUCKET and VASTDB_NETFLOW_SCHEMA and VASTDB_NETFLOW_TABLE):
+        print("VASTDB_NETFLOW_BUCKET, VASTDB_NETFLOW_SCHEMA and VASTDB_NETFLOW_TABLE env vars are required.")
+        sys.exit(1)
+
+    sql = QUERY.format(bucket=VASTDB_NETFLOW_BUCKET, schema=VASTDB_NETFLOW_SCHEMA, table=VASTDB_NETFLOW_TABLE,
+                       window=args.window_minutes, limit=args.limit)
+    cursor = connect(args.host, args.port, args.user).cursor()
+
+    for _ in range(args.warmup):
+        run_query(cursor, sql)
+
+    client_latency = LatencyHistogram()
+    server_latency = LatencyHistogram()
+    processed_rows = processed_bytes = 0
+    for n in range(args.runs):
+        latency, stats = run_query(cursor, sql)
+        client_latency.record(latency)
+        server_latency.record(stats.get('elapsedTimeMillis', 0) / 1000)
+        processed_rows += stats.get('processedRows', 0)
+        processed_bytes += stats.get('processedBytes', 0)
+        if n + 1 < args.runs:
+            time.sleep(args.interval)
+
+    rows = table_rows(cursor)
+    label = f"{args.label} " if args.label else ""
+    print(format_latency(f"{label}client latency", client_latency))
+    print(format_latency(f"{label}trino elapsed", server_latency))
+    print(f"{label}read {processed_rows / args.runs:,.0f} rows ({processed_bytes / args.runs / 1e6:.1f} MB) "
+          f"per query from a table of {rows:,} rows")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        started = datetime.datetime.now()
+        path = os.path.join(args.output, f"query-{args.label or 'run'}-{started:%Y%m%dT%H%M%S}.json")
+        summary = {
+            'timestamp': started.isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'config': vars(args),
+            'query': sql.strip(),
+            'table_rows': rows,
+            'client_latency': client_latency.summary(),
+            'trino_elapsed': server_latency.summary(),
+            'processed_rows_per_query': processed_rows / args.runs,
+            'processed_bytes_per_query': processed_bytes / args.runs,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print(f"Query benchmark summary written to {path}")
+
+if __name__ == "__main__":
+    main()
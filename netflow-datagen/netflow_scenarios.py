@@ -0,0 +1,144 @@
+"""
+Correlated traffic scenarios for the netflow generator (see
+`netflow_load_batch.py --zipf`, `--scan-rate`, `--exfil-rate` and
+`--ddos-rate`).
+
+`ScenarioEngine` replaces uniform host selection with Zipf-skewed host
+popularity and overlays attack traffic onto a generated batch:
+    port scans      bursts of short flows from one internal host to one
+                    suspicious address, walking sequential destination ports
+    exfiltration    bursts of long, large flows from one internal host to a
+                    suspicious address over 443 or 22
+    DDoS fan-in     small UDP/TCP flows from many external addresses to a
+                    single internal victim
+Overlay rates are fractions of the flows in each batch. Everything is
+drawn with vectorized NumPy calls on the generator's column arrays, where
+addresses are indices into the combined `hosts + external_ips` table.
+"""
+import numpy as np
+
+# The dst_ip filter of the 'Suspicious IP Addr Activity' chart on the
+# Netflow Data dashboard; scans and exfiltration target these addresses.
+SUSPICIOUS_IPS = [
+    '10.0.1.137',
+    '10.0.2.205',
+    '10.0.3.240',
+    '10.0.4.198',
+    '10.0.2.231',
+    '10.0.1.116',
+    '10.0.3.124',
+]
+
+TCP, UDP = 0, 1  # Indices into the generator's protocols
+
+def zipf_cdf(n, exponent, seed):
+    """
+    Cumulative Zipf distribution over `n` items, with ranks assigned by a
+    fixed permutation so popular items are spread over the address range
+    and are the same in every writer process.
+    """
+    ranks = np.random.default_rng(seed).permutation(n) + 1
+    weights = 1.0 / ranks.astype(np.float64) ** exponent
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+class ScenarioEngine:
+    """
+    Skewed host selection and attack overlays for generated flows.
+
+    Args:
+        num_hosts (int): internal hosts, addresses [0, num_hosts)
+        num_external (int): external addresses, which follow the hosts
+        suspicious (list[int]): address indices scans and exfiltration target
+        zipf (float): Zipf exponent for host and destination popularity,
+            0 for uniform
+        scan_rate, exfil_rate, ddos_rate (float): fraction of flows in each
+            batch replaced by that scenario
+        scan_burst, exfil_burst (int): flows per scan or exfiltration burst
+    """
+    def __init__(self, num_hosts, num_external, suspicious, zipf=0.0, scan_rate=0.0, exfil_rate=0.0,
+                 ddos_rate=0.0, scan_burst=256, exfil_burst=16):
+        self.num_hosts = num_hosts
+        self.num_external = num_external
+        self.suspicious = np.asarray(suspicious, dtype=np.int64)
+        self.zipf = zipf
+        self.scan_rate = scan_rate
+        self.exfil_rate = exfil_rate
+        self.ddos_rate = ddos_rate
+        self.scan_burst = scan_burst
+        self.exfil_burst = exfil_burst
+        if zipf:
+            self.host_cdf = zipf_cdf(num_hosts, zipf, seed=1)
+            self.external_cdf = zipf_cdf(num_external, zipf, seed=2)
+        # Fixed so that fan-in from every batch and writer hits the same host
+        self.ddos_victim = int(np.random.default_rng(3).integers(0, num_hosts))
+
+    def draw_hosts(self, rng, n):
+        """Indices of `n` internal hosts."""
+        if self.zipf:
+            return np.searchsorted(self.host_cdf, rng.random(n))
+        return rng.integers(0, self.num_hosts, n)
+
+    def draw_external(self, rng, n):
+        """Indices of `n` external addresses."""
+        if self.zipf:
+            return self.num_hosts + np.searchsorted(self.external_cdf, rng.random(n))
+        return self.num_hosts + rng.integers(0, self.num_external, n)
+
+    def _rows(self, rng, taken, rate):
+        """Pick a random subset of the rows not yet used by another overlay."""
+        free = np.flatnonzero(~taken)
+        n = min(int(rng.binomial(len(taken), rate)), len(free))
+        rows = rng.choice(free, n, replace=False) if n else free[:0]
+        taken[rows] = True
+        return rows
+
+    def _port_scans(self, rng, flows, rows):
+        n = len(rows)
+        burst = np.arange(n) // self.scan_burst
+        bursts = int(burst[-1]) + 1
+        start_port = rng.integers(1, 65536 - self.scan_burst, bursts)
+        flows['src'][rows] = self.draw_hosts(rng, bursts)[burst]
+        flows['dst'][rows] = rng.choice(self.suspicious, bursts)[burst]
+        flows['src_port'][rows] = rng.integers(49152, 65536, bursts, dtype=np.int32)[burst]
+        flows['dst_port'][rows] = (start_port[burst] + np.arange(n) % self.scan_burst).astype(np.int32)
+        flows['protocol'][rows] = TCP
+        flows['duration'][rows] = rng.integers(0, 6, n)
+        flows['bytes_sent'][rows] = rng.integers(40, 121, n)
+        flows['packets'][rows] = rng.integers(1, 3, n)
+
+    def _exfiltration(self, rng, flows, rows):
+        n = len(rows)
+        burst = np.arange(n) // self.exfil_burst
+        bursts = int(burst[-1]) + 1
+        bytes_sent = rng.lognormal(np.log(2e7), 1.0, n).astype(np.int64) + 1000000
+        flows['src'][rows] = self.draw_hosts(rng, bursts)[burst]
+        flows['dst'][rows] = rng.choice(self.suspicious, bursts)[burst]
+        flows['dst_port'][rows] = rng.choice(np.array([443, 22], dtype=np.int32), bursts)[burst]
+        flows['protocol'][rows] = TCP
+        flows['duration'][rows] = rng.integers(10000, 600001, n)
+        flows['bytes_sent'][rows] = bytes_sent
+        flows['packets'][rows] = bytes_sent // 1400 + 1
+
+    def _ddos(self, rng, flows, rows):
+        n = len(rows)
+        flows['src'][rows] = self.num_hosts + rng.integers(0, self.num_external, n)
+        flows['dst'][rows] = self.ddos_victim
+        flows['src_port'][rows] = rng.integers(1024, 65536, n, dtype=np.int32)
+        flows['dst_port'][rows] = rng.choice(np.array([80, 443, 53], dtype=np.int32), n)
+        flows['protocol'][rows] = rng.integers(0, 2, n)
+        flows['duration'][rows] = rng.integers(0, 11, n)
+        flows['bytes_sent'][rows] = rng.integers(60, 201, n)
+        flows['packets'][rows] = rng.integers(1, 4, n)
+
+    def apply(self, rng, flows):
+        """Overlay the configured scenarios onto `flows`, a dict of column arrays, in place."""
+        taken = np.zeros(len(flows['src']), dtype=bool)
+        for rate, overlay in ((self.scan_rate, self._port_scans),
+                              (self.exfil_rate, self._exfiltration),
+                              (self.ddos_rate, self._ddos)):
+            if rate:
+                rows = self._rows(rng, taken, rate)
+                if len(rows):
+                    overlay(rng, flows, rows)
+        return flows
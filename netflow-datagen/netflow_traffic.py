@@ -0,0 +1,175 @@
+"""
+Batch sizing for the netflow loader: a fixed size, an AIMD controller
+that adapts the size to observed insert latency, or batches that follow a
+diurnal or bursty traffic profile (see `netflow_load_batch.py --adaptive`
+and `--profile`).
+
+Every sizer is constructed with the writer's target `rate` and the
+initial `batch_rows`, and provides:
+    next_size()                 rows to generate for the next insert
+    current_rate()              rows/sec the insert should be paced to
+    observe(rows, latency)      feedback after each insert
+    describe()                  short status for interval reports
+    summary()                   dict describing the sizing for run summaries
+"""
+import math
+import time
+
+import numpy as np
+
+class FixedBatchSize:
+    """Every insert has `batch_rows` rows, paced to a constant rate."""
+    def __init__(self, rate, batch_rows):
+        self.rate = rate
+        self.size = batch_rows
+
+    def next_size(self):
+        return self.size
+
+    def current_rate(self):
+        return self.rate
+
+    def observe(self, rows, latency):
+        pass
+
+    def describe(self):
+        return ""
+
+    def summary(self):
+        return {'mode': 'fixed', 'batch_rows': self.size}
+
+class AdaptiveBatchSize:
+    """
+    Additive-increase/multiplicative-decrease batch size controller.
+
+    In 'latency' mode the batch grows by `step` rows while inserts finish
+    within `target_latency` seconds and is cut by `decrease` when one is
+    slower. In 'throughput' mode the batch grows while the rows/sec of an
+    insert keeps up with the smoothed rows/sec so far (within
+    `tolerance`), and is cut when it falls behind, so the size oscillates
+    around the knee of the throughput curve. The best size seen is
+    reported in either mode.
+    """
+    def __init__(self, rate, batch_rows, target='latency', target_latency=0.5,
+                 min_rows=1000, max_rows=1000000, step=None, decrease=0.5, tolerance=0.05):
+        assert target in ['latency', 'throughput']
+        self.rate = rate
+        self.target = target
+        self.target_latency = target_latency
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.step = step or max(min_rows, batch_rows // 4)
+        self.decrease = decrease
+        self.tolerance = tolerance
+        self.size = min(max(batch_rows, min_rows), max_rows)
+        self.smoothed = None
+        self.best_rows = self.size
+        self.best_throughput = 0.0
+        self.increases = self.decreases = 0
+
+    def next_size(self):
+        return self.size
+
+    def current_rate(self):
+        return self.rate
+
+    def observe(self, rows, latency):
+        throughput = rows / latency if latency > 0 else 0.0
+        if throughput > self.best_throughput and (self.target == 'throughput' or latency <= self.target_latency):
+            self.best_throughput = throughput
+            self.best_rows = rows
+
+        if self.target == 'latency':
+            grow = latency <= self.target_latency
+        else:
+            grow = self.smoothed is None or throughput >= self.smoothed * (1 - self.tolerance)
+            self.smoothed = throughput if self.smoothed is None else 0.8 * self.smoothed + 0.2 * throughput
+
+        if grow:
+            self.size = min(self.size + self.step, self.max_rows)
+            self.increases += 1
+        else:
+            self.size = max(int(self.size * self.decrease), self.min_rows)
+            self.decreases += 1
+
+    def describe(self):
+        return f"batch {self.size} rows, best {self.best_rows} rows at {self.best_throughput:,.0f} rows/sec"
+
+    def summary(self):
+        return {
+            'mode': f'adaptive-{self.target}',
+            'batch_rows': self.size,
+            'best_batch_rows': self.best_rows,
+            'best_rows_per_sec': self.best_throughput,
+            'increases': self.increases,
+            'decreases': self.decreases,
+        }
+
+class TrafficProfile:
+    """
+    Batches that follow a time-varying traffic rate instead of a fixed size.
+
+    The rate follows `profile` around the mean `rate`:
+        'diurnal'   a sine wave over `period` seconds (a day by default,
+                    aligned to local midnight), between (1 - amplitude)
+                    and (1 + amplitude) times `rate`
+        'bursty'    `rate` with random bursts of `burst_factor` times the
+                    rate, starting on average every `burst_every` seconds
+                    and lasting `burst_length` seconds
+    Each insert carries the flows that arrived over `flush_interval`
+    seconds at the current rate, drawn from a Poisson distribution.
+    """
+    def __init__(self, rate, batch_rows, profile='diurnal', flush_interval=1.0, period=86400.0,
+                 amplitude=0.8, burst_factor=5.0, burst_every=60.0, burst_length=5.0):
+        assert profile in ['diurnal', 'bursty']
+        self.rate = rate
+        self.profile = profile
+        self.flush_interval = flush_interval
+        self.period = period
+        self.amplitude = amplitude
+        self.burst_factor = burst_factor
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.bursting = False
+        self.bursts = 0
+        self.last = time.monotonic()
+        self.rng = np.random.default_rng()
+        self.last_rate = self.peak_rate = 0.0
+
+    def _multiplier(self):
+        if self.profile == 'diurnal':
+            now = time.time() + time.localtime().tm_gmtoff
+            phase = (now % self.period) / self.period
+            # Trough at midnight, peak at midday
+            return 1 - self.amplitude * math.cos(2 * math.pi * phase)
+
+        now = time.monotonic()
+        elapsed, self.last = now - self.last, now
+        if self.bursting:
+            if self.rng.random() < 1 - math.exp(-elapsed / self.burst_length):
+                self.bursting = False
+        elif self.rng.random() < 1 - math.exp(-elapsed / self.burst_every):
+            self.bursting = True
+            self.bursts += 1
+        return self.burst_factor if self.bursting else 1.0
+
+    def current_rate(self):
+        self.last_rate = self.rate * self._multiplier()
+        self.peak_rate = max(self.peak_rate, self.last_rate)
+        return self.last_rate
+
+    def next_size(self):
+        return max(1, int(self.rng.poisson(self.current_rate() * self.flush_interval)))
+
+    def observe(self, rows, latency):
+        pass
+
+    def describe(self):
+        return f"profile rate {self.last_rate:,.0f} rows/sec"
+
+    def summary(self):
+        summary = {'mode': f'profile-{self.profile}', 'flush_interval': self.flush_interval,
+                   'peak_rate': self.peak_rate}
+        if self.profile == 'bursty':
+            summary['bursts'] = self.bursts
+        return summary
@@ -9,22 +9,14 @@ export VASTDB_NETFLOW_BUCKET
 export VASTDB_NETFLOW_SCHEMA
 export VASTDB_NETFLOW_TABLE
 
-MODULE_NAME="vastdb"
-
-if ! python3 -c "import $MODULE_NAME" 2>/dev/null; then
-    echo "Error: Python module '$MODULE_NAME' is not installed. Please install it using 'pip install $MODULE_NAME'." >&2
-    exit 1
-fi
-
-while :
+for MODULE_NAME in vastdb numpy
 do
-        python3 netflow_load_batch.py
-        echo -n "."
-        sleep 9
+    if ! python3 -c "import $MODULE_NAME" 2>/dev/null; then
+        echo "Error: Python module '$MODULE_NAME' is not installed. Please install it using 'pip install $MODULE_NAME'." >&2
+        exit 1
+    fi
 done
 
-
-
-
-
-
+# Stream continuously over a single VastDB session; extra arguments
+# (e.g. --rate 50000 --batch-rows 10000) are passed through.
+exec python3 netflow_load_batch.py --stream "$@"
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Structural diff of two NiFi flow definitions (as exported from NiFi or
+checked in next to import_flow.py).
+
+Both flows are indexed by component identifier, so reordered lists and
+moved components on the canvas don't show up as changes; layout fields
+(positions, connection bends, label styles) and instance identifiers are
+ignored. Added, removed and changed process groups, processors,
+connections, controller services, ports, funnels, labels and parameters
+are reported with the process groups they belong to.
+
+Exit status is 0 if the flows are equivalent, 1 if they differ and 2 on
+error, so deploy scripts can decide whether a redeploy is needed:
+
+    python3 flow_diff.py deployed/NiFi_Flow.json NiFi_Flow.json --quiet || python3 import_flow.py --sync
+"""
+
+import argparse
+import json
+import sys
+
+# Child component lists of a process group and the kind of component they hold
+COMPONENT_LISTS = {
+    'processGroups': 'process group',
+    'processors': 'processor',
+    'connections': 'connection',
+    'controllerServices': 'controller service',
+    'inputPorts': 'input port',
+    'outputPorts': 'output port',
+    'funnels': 'funnel',
+    'labels': 'label',
+    'remoteProcessGroups': 'remote process group',
+}
+
+# Fields that only record canvas layout or the NiFi instance a flow was
+# exported from
+IGNORED_FIELDS = {'position', 'bends', 'labelIndex', 'zIndex', 'style', 'width', 'height', 'instanceIdentifier'}
+
+# Fields compared entry by entry rather than as a whole
+KEYED_FIELDS = {'properties': 'property', 'parameters': 'parameter'}
+
+def strip_layout(value):
+    """Return `value` without IGNORED_FIELDS at any depth."""
+    if isinstance(value, dict):
+        return {k: strip_layout(v) for k, v in value.items() if k not in IGNORED_FIELDS}
+    if isinstance(value, list):
+        return [strip_layout(v) for v in value]
+    return value
+
+def component_name(kind, component):
+    if kind == 'connection' and not component.get('name'):
+        return f"{component['source'].get('name')} -> {component['destination'].get('name')}"
+    return component.get('name') or component.get('label') or component['identifier']
+
+def index_flow(definition):
+    """
+    Index every component of a flow definition by identifier.
+
+    Args:
+        definition (dict): a flow definition with 'flowContents', or a
+            bare process group
+
+    Returns:
+        dict: {identifier: {'kind', 'name', 'group', 'fields'}}, where
+            'group' is the path of process group names the component is
+            in and 'fields' its settings without layout or children
+    """
+    index = {}
+    root = definition.get('flowContents', definition)
+    groups = [(root, None)]
+    while groups:
+        group, parent_path = groups.pop()
+        path = group.get('name', '') if parent_path is None else f"{parent_path}/{group.get('name', '')}"
+        fields = strip_layout({k: v for k, v in group.items() if k not in COMPONENT_LISTS})
+        index[group['identifier']] = {
+            'kind': 'process group', 'name': group.get('name', ''), 'group': parent_path or path, 'fields': fields,
+        }
+        for list_name, kind in COMPONENT_LISTS.items():
+            for component in group.get(list_name) or []:
+                if list_name == 'processGroups':
+                    groups.append((component, path))
+                    continue
+                index[component['identifier']] = {
+                    'kind': kind, 'name': component_name(kind, component), 'group': path,
+                    'fields': strip_layout(component),
+                }
+
+    for name, context in (definition.get('parameterContexts') or {}).items():
+        fields = strip_layout(context)
+        fields['parameters'] = {p['name']: p for p in fields.get('parameters') or []}
+        index[f"parameter-context:{name}"] = {
+            'kind': 'parameter context', 'name': name, 'group': None, 'fields': fields,
+        }
+    return index
+
+def diff_fields(old, new):
+    """
+    List the differences between two components' fields.
+
+    Returns:
+        list[dict]: {'field', 'old', 'new'}, with properties and parameters
+            reported one by one as e.g. 'property Topics'
+    """
+    changes = []
+    for key in sorted(old.keys() | new.keys()):
+        old_value, new_value = old.get(key), new.get(key)
+        if old_value == new_value:
+            continue
+        if key in KEYED_FIELDS and isinstance(old_value or {}, dict) and isinstance(new_value or {}, dict):
+            old_value, new_value = old_value or {}, new_value or {}
+            for name in sorted(old_value.keys() | new_value.keys()):
+                if old_value.get(name) != new_value.get(name):
+                    changes.append({'field': f"{KEYED_FIELDS[key]} {name}",
+                                    'old': old_value.get(name), 'new': new_value.get(name)})
+        else:
+            changes.append({'field': key, 'old': old_value, 'new': new_value})
+    return changes
+
+def diff_flows(old_definition, new_definition):
+    """
+    Compare two flow definitions component by component.
+
+    Returns:
+        dict: 'added', 'removed' and 'changed' components, each
+            {'kind', 'id', 'name', 'group'} ('changed' with their
+            'changes' from diff_fields), and 'groups', the sorted paths of
+            the process groups that are affected
+    """
+    old_index = index_flow(old_definition)
+    new_index = index_flow(new_definition)
+
+    def entry(identifier, component):
+        return {'kind': component['kind'], 'id': identifier, 'name': component['name'], 'group': component['group']}
+
+    result = {'added': [], 'removed': [], 'changed': [], 'groups': set()}
+    for identifier, old in old_index.items():
+        new = new_index.get(identifier)
+        if new is None:
+            result['removed'].append(entry(identifier, old))
+            result['groups'].add(old['group'])
+            continue
+        changes = diff_fields(old['fields'], new['fields'])
+        if changes:
+            result['changed'].append(dict(entry(identifier, new), changes=changes))
+            result['groups'].update((old['group'], new['group']))
+    for identifier, new in new_index.items():
+        if identifier not in old_index:
+            result['added'].append(entry(identifier, new))
+            result['groups'].add(new['group'])
+
+    result['groups'].discard(None)
+    result['groups'] = sorted(result['groups'])
+    return result
+
+def is_different(result):
+    return bool(result['added'] or result['removed'] or result['changed'])
+
+def short(value, width=80):
+    text = json.dumps(value, sort_keys=True)
+    return text if len(text) <= width else text[:width - 3] + '...'
+
+def format_diff(result):
+    """Render a diff_flows result as text, grouped by process group."""
+    by_group = {}
+    for sign, key in (('+', 'added'), ('-', 'removed'), ('~', 'changed')):
+        for item in result[key]:
+            by_group.setdefault(item['group'] or '(parameter contexts)', []).append((sign, item))
+
+    lines = []
+    for group in sorted(by_group):
+        lines.append(f"{group}:")
+        for sign, item in sorted(by_group[group], key=lambda x: (x[1]['kind'], x[1]['name'], x[0])):
+            lines.append(f"  {sign} {item['kind']} {item['name']} ({item['id']})")
+            for change in item.get('changes', []):
+                lines.append(f"      {change['field']}: {short(change['old'])} -> {short(change['new'])}")
+    lines.append(f"{len(result['added'])} added, {len(result['removed'])} removed, {len(result['changed'])} changed "
+                 f"in {len(result['groups'])} process groups")
+    return '\n'.join(lines)
+
+def load_flow(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare two NiFi flow definitions by component.")
+    parser.add_argument("old_file", help="Path to the old flow definition.")
+    parser.add_argument("new_file", help="Path to the new flow definition.")
+    parser.add_argument("--json", action="store_true", help="Print the differences as JSON.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Print nothing; only set the exit status.")
+
+    args = parser.parse_args()
+    try:
+        result = diff_flows(load_flow(args.old_file), load_flow(args.new_file))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error: Could not compare flows - {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.json:
+        print(json.dumps(result, indent=4, sort_keys=True))
+    elif not args.quiet:
+        print(format_diff(result))
+    sys.exit(1 if is_different(result) else 0)
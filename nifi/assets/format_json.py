@@ -1,27 +1,218 @@
 #!/usr/bin/env python3
+"""
+Deterministic formatting of JSON files (keys sorted, 4 space indent, ASCII)
+so flow definitions can be diffed.
+
+Large flow exports are formatted without holding the document as Python
+objects or the output as one string. The input file is memory-mapped, and
+one pass over it records, for the outer STREAM_DEPTH levels, each
+member's key and the span of its value in the input. Members are then
+formatted in sorted key order and written out as they are produced, each
+value nested deeper than STREAM_DEPTH being decoded from its span on its
+own. Memory is bounded by the largest of those values plus the recorded
+spans. The output is identical to normalize_json.
+"""
 
 import json
+import json.encoder
+import mmap
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def format_json(input_file, output_file=None):
-    """Deterministically formats a JSON file for easy diffing."""
+# Values nested deeper than this are decoded in one go. The members of the
+# levels above are recorded as spans of the input, which bounds how much of
+# the document is held as Python objects at any time.
+STREAM_DEPTH = 6
+
+INDENT = ' ' * 4
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Opening and closing brackets, and strings skipped whole so the brackets
+# in them don't count
+_TOKEN = re.compile(rb'([\[{])|([\]}])|"[^"\\]*(?:\\.[^"\\]*)*"|(")', re.DOTALL)
+_SCALAR = re.compile(rb'[^ \t\n\r,\]}]*')
+_encode_key = json.encoder.encode_basestring_ascii
+
+def normalize_json(data):
+    """Deterministic text form of parsed JSON, also used to hash flow definitions."""
+    return json.dumps(
+        data,
+        indent=4,
+        sort_keys=True,
+        ensure_ascii=True
+    )
+
+def _skip(buf, idx):
+    return _WHITESPACE.match(buf, idx).end()
+
+def _decode_error(message, buf, idx):
+    # Positions are reported in characters, as json.loads does for text
+    prefix = bytes(buf[:idx]).decode('utf-8', 'replace')
+    return json.JSONDecodeError(message, prefix, len(prefix))
+
+def _decode(buf, start, end):
+    """Decode the JSON value in buf[start:end]."""
+    try:
+        return json.loads(buf[start:end])
+    except json.JSONDecodeError as e:
+        raise _decode_error(e.msg, buf, start + len(e.doc[:e.pos].encode('utf-8'))) from None
+
+def _skip_string(buf, idx):
+    match = _STRING.match(buf, idx)
+    if not match:
+        raise _decode_error("Unterminated string starting at", buf, idx)
+    return match.end()
+
+def _skip_value(buf, idx):
+    """Index after the JSON value starting at `idx`, found without decoding it."""
+    char = buf[idx:idx + 1]
+    if char == b'"':
+        return _skip_string(buf, idx)
+    if char in (b'{', b'['):
+        level = 0
+        for match in _TOKEN.finditer(buf, idx):
+            if match.lastindex == 1:
+                level += 1
+            elif match.lastindex == 2:
+                level -= 1
+                if not level:
+                    return match.end()
+            elif match.lastindex == 3:
+                # An opening quote without its closing one
+                break
+        raise _decode_error("Unterminated object or array starting at", buf, idx)
+    end = _SCALAR.match(buf, idx).end()
+    if end == idx:
+        raise _decode_error("Expecting value", buf, idx)
+    return end
+
+def _index_value(buf, idx, depth):
+    """
+    Record the structure of the JSON value starting at `idx`, nested
+    `depth` levels deep.
+
+    Returns:
+        (dict, list or tuple, int): members of an object by key, or of an
+            array, each recorded the same way; or the (start, end) span of
+            a scalar or of a value at STREAM_DEPTH. And the index after
+            the value.
+    """
+    char = buf[idx:idx + 1]
+    if depth >= STREAM_DEPTH or char not in (b'{', b'['):
+        end = _skip_value(buf, idx)
+        return (idx, end), end
+
+    close = b'}' if char == b'{' else b']'
+    members = {} if char == b'{' else []
+    idx = _skip(buf, idx + 1)
+    if buf[idx:idx + 1] == close:
+        return members, idx + 1
+
+    while True:
+        if char == b'{':
+            if buf[idx:idx + 1] != b'"':
+                raise _decode_error("Expecting property name enclosed in double quotes", buf, idx)
+            end = _skip_string(buf, idx)
+            key = _decode(buf, idx, end)
+            idx = _skip(buf, end)
+            if buf[idx:idx + 1] != b':':
+                raise _decode_error("Expecting ':' delimiter", buf, idx)
+            idx = _skip(buf, idx + 1)
+            value, idx = _index_value(buf, idx, depth + 1)
+            # As with json.load, the last of duplicate keys wins
+            members[key] = value
+        else:
+            value, idx = _index_value(buf, idx, depth + 1)
+            members.append(value)
+        idx = _skip(buf, idx)
+        separator = buf[idx:idx + 1]
+        if separator == close:
+            break
+        if separator != b',':
+            raise _decode_error("Expecting ',' delimiter", buf, idx)
+        idx = _skip(buf, idx + 1)
+    return members, idx + 1
+
+def _iter_formatted(buf, node, depth):
+    """Yield the formatted form of a value recorded by _index_value."""
+    if isinstance(node, tuple):
+        value = _decode(buf, *node)
+        formatted = normalize_json(value)
+        if depth and isinstance(value, (dict, list)):
+            formatted = formatted.replace('\n', '\n' + INDENT * depth)
+        yield formatted
+        return
+
+    is_object = isinstance(node, dict)
+    if not node:
+        yield '{}' if is_object else '[]'
+        return
+
+    inner = '\n' + INDENT * (depth + 1)
+    if is_object:
+        items = ((inner + _encode_key(key) + ': ', node[key]) for key in sorted(node))
+    else:
+        items = ((inner, member) for member in node)
+    yield '{' if is_object else '['
+    for n, (prefix, member) in enumerate(items):
+        yield ',' + prefix if n else prefix
+        yield from _iter_formatted(buf, member, depth + 1)
+    yield '\n' + INDENT * depth + ('}' if is_object else ']')
+
+def iter_normalized_json(buf):
+    """
+    Yield normalize_json(json.loads(buf)) in pieces, for UTF-8 JSON in a
+    bytes-like object such as a memory-mapped file.
+
+    Raises:
+        json.JSONDecodeError: if `buf` is not valid JSON
+    """
+    idx = _skip(buf, 0)
+    if idx == len(buf):
+        raise _decode_error("Expecting value", buf, idx)
+    node, idx = _index_value(buf, idx, 0)
+    if _skip(buf, idx) != len(buf):
+        raise _decode_error("Extra data", buf, _skip(buf, idx))
+    return _iter_formatted(buf, node, 0)
+
+def write_normalized_json(buf, out):
+    """Write the formatted form of `buf` and a final newline to the file object `out`."""
+    for piece in iter_normalized_json(buf):
+        out.write(piece)
+    out.write("\n")
+
+def _format_mapped(input_file, output_file):
+    with open(input_file, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            # An empty file can't be mapped; it is reported as invalid JSON
+            buf = b''
+        else:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
     try:
-        with open(input_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        
-        formatted_json = json.dumps(
-            data, 
-            indent=4, 
-            sort_keys=True, 
-            ensure_ascii=True
-        )
-        
         if output_file:
-            with open(output_file, "w", encoding="utf-8") as f:
-                f.write(formatted_json + "\n")
+            # Written beside the target and renamed, so the input can also be the output
+            tmp_file = f"{output_file}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    write_normalized_json(buf, f)
+                os.replace(tmp_file, output_file)
+            finally:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
         else:
-            print(formatted_json)
-    
+            write_normalized_json(buf, sys.stdout)
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+def format_json(input_file, output_file=None):
+    """Deterministically formats a JSON file for easy diffing."""
+    try:
+        _format_mapped(input_file, output_file)
     except json.JSONDecodeError as e:
         print(f"Error: Invalid JSON - {e}", file=sys.stderr)
         sys.exit(1)
@@ -29,13 +220,80 @@ def format_json(input_file, output_file=None):
         print(f"Error: File '{input_file}' not found.", file=sys.stderr)
         sys.exit(1)
 
+def _format_one(input_file, output_file):
+    start = time.monotonic()
+    try:
+        format_json(input_file, output_file)
+    except SystemExit:
+        return False, time.monotonic() - start
+    return True, time.monotonic() - start
+
+def expand_inputs(paths):
+    """The given files, and the *.json files in the given directories."""
+    out = []
+    for path in paths:
+        if os.path.isdir(path):
+            out += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json'))
+        else:
+            out.append(path)
+    return out
+
+def format_json_files(input_files, output_dir=None, max_workers=None):
+    """
+    Format many JSON files in parallel, one process per core by default.
+
+    Args:
+        input_files (list[str]): files to format
+        output_dir (str): directory for the formatted files, None to
+            format them in place
+        max_workers (int): processes to use
+
+    Returns:
+        (bool): True if every file was formatted
+    """
+    start = time.monotonic()
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_format_one, path,
+                        os.path.join(output_dir, os.path.basename(path)) if output_dir else path): path
+            for path in input_files
+        }
+        for future in as_completed(futures):
+            ok, elapsed = future.result()
+            if not ok:
+                failed += 1
+            print(f"{'Formatted' if ok else 'Failed'} {futures[future]} in {elapsed:.1f}s", file=sys.stderr)
+    print(f"Formatted {len(input_files) - failed} of {len(input_files)} files in "
+          f"{time.monotonic() - start:.1f}s", file=sys.stderr)
+    return not failed
+
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description="Format JSON for easier diffing.")
-    parser.add_argument("input_file", help="Path to the input JSON file.")
+    parser.add_argument("input_file", nargs="+",
+                        help="Path to the input JSON file; several files or directories of *.json files "
+                             "are formatted in parallel with --in-place or --output-dir.")
     parser.add_argument("-o", "--output", help="Optional output file path.")
-    
+    parser.add_argument("--in-place", action="store_true", help="Replace each input file with its formatted form.")
+    parser.add_argument("--output-dir", help="Write formatted files into this directory.")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Files formatted at once (default: number of CPUs).")
+
     args = parser.parse_args()
-    format_json(args.input_file, args.output)
+    batch = args.in_place or args.output_dir
+    if args.output and (batch or len(args.input_file) > 1):
+        parser.error("-o/--output takes a single input file; use --output-dir or --in-place for several")
+    if args.in_place and args.output_dir:
+        parser.error("--in-place and --output-dir are mutually exclusive")
+    if not batch and (len(args.input_file) > 1 or os.path.isdir(args.input_file[0])):
+        parser.error("several input files need --output-dir or --in-place")
 
+    if batch:
+        if not format_json_files(expand_inputs(args.input_file), args.output_dir, args.jobs):
+            sys.exit(1)
+    else:
+        format_json(args.input_file[0], args.output)
@@ -1,18 +1,20 @@
-import ssl
+import argparse
+import glob
+import hashlib
+import io
+import json
 import logging
 import os
-import requests
-import six
+import re
 import sys
-from requests.adapters import HTTPAdapter
-from urllib3.poolmanager import PoolManager
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import nipyapi
-from nipyapi.nifi.api_client import ApiClient
-from nipyapi.nifi.apis.access_api import AccessApi
-from nipyapi import config
+from nipyapi import canvas
 
-# Disable SSL warnings
-requests.packages.urllib3.disable_warnings()
+from format_json import normalize_json
+from nifi_client import NiFiClient
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR)
@@ -21,76 +23,6 @@ urllib3_logger.setLevel(logging.ERROR)
 nipyapi_logger = logging.getLogger("nipyapi")
 nipyapi_logger.setLevel(logging.ERROR)
 
-class SSLAdapter(HTTPAdapter):
-    """Custom adapter to handle SSL without certificate verification."""
-    def init_poolmanager(self, connections, maxsize, block=False):
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        self.poolmanager = PoolManager(
-            num_pools=connections,
-            maxsize=maxsize,
-            block=block,
-            ssl_version=ssl.PROTOCOL_TLS,
-            ssl_context=context
-        )
-
-def setup_nifi_connection(host_url, username, password):
-
-    adapter = SSLAdapter()
-
-    # Create custom session with SSL adapter
-    session = requests.Session()
-    session.verify = False
-    session.mount('https://', adapter)
-
-    # Create API client and configure authentication
-    api_client = ApiClient()
-    api_client.host = host_url
-    api_client.verify = False
-    api_client.rest_client.pool_manager = adapter.poolmanager
-
-    # Configure NiFi connection settings
-    access_api = AccessApi(api_client)
-    config.nifi_config.api_client = api_client
-    config.nifi_config.host = host_url
-    config.nifi_config.verify_ssl = False
-
-    try:
-        # Authenticate and get access token
-        response = session.post(
-            f"{host_url}/access/token",
-            data={"username": username, "password": password}
-        )
-
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Authentication failed with status code {response.status_code}")
-
-        access_token = response.text.strip()  # Strip any whitespace
-        if not access_token:
-            raise Exception("No access token found in response.")
-
-        # Set authorization headers
-        session.headers.update({"Authorization": f"Bearer {access_token}"})
-
-        # Transfer cookies to NiFi configuration
-        config.nifi_config.cookies = session.cookies
-
-        # Set the Authorization header on ApiClient
-        api_client.default_headers['Authorization'] = f'Bearer {access_token}'
-
-        # Transfer cookies from session to ApiClient
-        for cookie in session.cookies:
-            api_client.set_default_header("Cookie", f"{cookie.name}={cookie.value}")
-
-        print("NiFi connection successfully set up with authentication.")
-        return api_client
-
-    except Exception as e:
-        print(f"Authentication error: {str(e)}")
-        raise
-
-
 def get_root_pg_id(api_client):
     """
     Convenience function to return the UUID of the Root Process Group
@@ -100,171 +32,135 @@ def get_root_pg_id(api_client):
     return nipyapi.nifi.FlowApi(api_client).get_process_group_status('root') \
         .process_group_status.id
 
-def recurse_flow(pg_id='root'):
-    """
-    Returns information about a Process Group and all its Child Flows.
-    Recurses the child flows by appending each process group with a
-    'nipyapi_extended' parameter which contains the child process groups, etc.
-    Note: This previously used actual recursion which broke on large NiFi
-        environments, we now use a task/list update approach
-
-    Args:
-        pg_id (str): The Process Group UUID
+# Marker appended to the comments of an imported Process Group, recording
+# the hash of the flow definition it was created from
+FLOW_HASH_MARKER = re.compile(r'flow sha256: ([0-9a-f]{64})')
+FLOW_HASH_LINE = re.compile(r'\n?Imported from .* by import_flow\.py \(flow sha256: [0-9a-f]{64}\)')
 
-    Returns:
-         (ProcessGroupFlowEntity): enriched NiFi Flow object
+def flow_hash(file_path):
     """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
-
-    out = get_flow(pg_id)
-    tasks = [(x.id, x) for x in out.process_group_flow.flow.process_groups]
-    while tasks:
-        this_pg_id, this_parent_obj = tasks.pop()
-        this_flow = get_flow(this_pg_id)
-        this_parent_obj.__setattr__(
-            'nipyapi_extended',
-            this_flow
-        )
-        tasks += [(x.id, x) for x in
-                  this_flow.process_group_flow.flow.process_groups]
-    return out
-
-def get_flow(pg_id='root'):
+    SHA-256 of a flow definition in the normalized form written by
+    format_json.py, so whitespace and key order changes don't count.
     """
-    Returns information about a Process Group and flow.
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return hashlib.sha256(normalize_json(json.load(f)).encode()).hexdigest()
 
-    This surfaces the native implementation, for the recursed implementation
-    see 'recurse_flow'
+def get_top_level_group(pg_name):
+    """Return the Process Group directly under root named exactly `pg_name`, or None."""
+    groups = nipyapi.nifi.ProcessGroupsApi().get_process_groups('root').process_groups
+    return next((pg for pg in groups if pg.component.name == pg_name), None)
 
-    Args:
-        pg_id (str): id of the Process Group to retrieve, defaults to the root
-            process group if not set
-
-    Returns:
-         (ProcessGroupFlowEntity): The Process Group object
-    """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
-    with nipyapi.utils.rest_exceptions():
-        return nipyapi.nifi.FlowApi().get_flow(pg_id)
+def deployed_flow_hash(process_group):
+    """Hash recorded by a previous import, or None if the group wasn't created by one."""
+    match = FLOW_HASH_MARKER.search(process_group.component.comments or '')
+    return match.group(1) if match else None
 
-
-def get_process_group_status(pg_id='root', detail='names'):
+def record_flow_hash(pg_id, fname, digest):
     """
-    Returns an entity containing the status of the Process Group.
-    Optionally may be configured to return a simple dict of name:id pairings
-
-    Note that there is also a 'process group status' command available, but it
-    returns a subset of this data anyway, and this call is more useful
-
-    Args:
-        pg_id (str): The UUID of the Process Group
-        detail (str): 'names' or 'all'; whether to return a simple dict of
-            name:id pairings, or the full details. Defaults to 'names'
-
-    Returns:
-         (ProcessGroupEntity): The Process Group Entity including the status
+    Append the hash of the imported definition to the Process Group's
+    comments, keeping the comments that came with the definition and
+    replacing the marker of an earlier import.
     """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
-    assert detail in ['names', 'all']
-    raw = nipyapi.nifi.ProcessGroupsApi().get_process_group(id=pg_id)
-    if detail == 'names':
-        out = {
-            raw.component.name: raw.component.id
-        }
-        return out
-    return raw
+    process_group = nipyapi.nifi.ProcessGroupsApi().get_process_group(pg_id)
+    comments = FLOW_HASH_LINE.sub('', process_group.component.comments or '')
+    marker = f'Imported from {fname} by import_flow.py (flow sha256: {digest})'
+    nipyapi.nifi.ProcessGroupsApi().update_process_group(
+        id=pg_id,
+        body=nipyapi.nifi.ProcessGroupEntity(
+            component=nipyapi.nifi.ProcessGroupDTO(
+                id=pg_id,
+                comments=f'{comments}\n{marker}' if comments else marker
+            ),
+            revision=process_group.revision
+        )
+    )
 
-def get_process_group(identifier, identifier_type='name', greedy=True):
+class MultipartFileBody:
     """
-    Filters the list of all process groups against a given identifier string
-    occurring in a given identifier_type field.
+    multipart/form-data request body with form fields and one file, read
+    from disk in chunks while it is sent instead of being built in memory.
+    Has a length, so requests sends it with a Content-Length header. Use
+    it as a context manager, so the file is closed even if the request
+    fails before the body has been read.
 
     Args:
-        identifier (str): the string to filter the list for
-        identifier_type (str): the field to filter on, set in config.py
-        greedy (bool): True for partial match, False for exact match
-
-    Returns:
-        None for no matches, Single Object for unique match,
-        list(Objects) for multiple matches
-
+        fields (dict): form field names and values
+        file_field (str): name of the file field
+        file_path (str): file to send
+        content_type (str): content type of the file
     """
-    assert isinstance(identifier, six.string_types)
-    assert identifier_type in ['name', 'id']
-    with nipyapi.utils.rest_exceptions():
-        if identifier_type == 'id' or identifier == 'root':
-            # assuming unique fetch of pg id, 'root' is special case
-            # implementing separately to avoid recursing entire canvas
-            out = nipyapi.nifi.ProcessGroupsApi().get_process_group(identifier)
-        else:
-            obj = list_all_process_groups()
-            out = nipyapi.utils.filter_obj(
-                obj, identifier, identifier_type, greedy=greedy)
-    return out
-
-def list_all_process_groups(pg_id='root'):
+    def __init__(self, fields, file_field, file_path, content_type='application/json'):
+        boundary = uuid.uuid4().hex
+        head = ''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                 f'filename="{os.path.basename(file_path)}"\r\nContent-Type: {content_type}\r\n\r\n')
+        tail = f'\r\n--{boundary}--\r\n'.encode()
+        self.content_type = f'multipart/form-data; boundary={boundary}'
+        self.length = len(head.encode()) + os.path.getsize(file_path) + len(tail)
+        self.parts = [io.BytesIO(head.encode()), open(file_path, 'rb'), io.BytesIO(tail)]
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        while self.parts:
+            self.parts.pop().close()
+
+    def read(self, size=-1):
+        while self.parts:
+            data = self.parts[0].read(size)
+            if data:
+                return data
+            self.parts.pop(0).close()
+        return b''
+
+def upload_flow_definition(client, file_path, pg_name, positionX, positionY, sync=False,
+                           replace_unmarked=False):
     """
-    Returns a flattened list of all Process Groups on the canvas.
-    Potentially slow if you have a large canvas.
+    Upload a flow definition as a new Process Group under root.
 
-    Note that the ProcessGroupsApi().get_process_groups(pg_id) command only
-    provides the first layer of pgs, whereas this trawls the entire canvas
-
-    Args:
-        pg_id (str): The UUID of the Process Group to start from, defaults to
-            the Canvas root
+    Without `sync` an existing group of the same name is an error. With
+    `sync` the group is left alone if it was imported from an identical
+    definition (by normalized hash), and otherwise deleted and imported
+    again in the same position. A group without a recorded hash wasn't
+    created by this script, or predates the hash, and may hold changes made
+    on the canvas; it is skipped unless `replace_unmarked` is set. The
+    file is streamed to NiFi.
 
     Returns:
-         list[ProcessGroupEntity]
+        (str): 'unchanged', 'skipped', 'created' or 'replaced'
 
+    Raises:
+        RuntimeError: if the group exists without `sync`, or the upload fails
     """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
-
-    def flatten(parent_pg):
-        """
-        Recursively flattens the native datatypes into a generic list.
-        Note that the root is a special case as it has no parent
-
-        Args:
-            parent_pg (ProcessGroupEntity): object to flatten
-
-        Yields:
-            Generator for all ProcessGroupEntities, eventually
-        """
-        for child_pg in parent_pg.process_group_flow.flow.process_groups:
-            for sub in flatten(child_pg.nipyapi_extended):
-                yield sub
-            yield child_pg
-
-    # Recurse children
-    root_flow = recurse_flow(pg_id)
-    # Flatten list of children with extended detail
-    out = list(flatten(root_flow))
-    # update parent with flattened list of extended child detail
-    root_entity = get_process_group(pg_id, 'id')
-    root_entity.__setattr__('nipyapi_extended', root_flow)
-    out.append(root_entity)
-    return out
-
-def upload_flow_definition(nifi_host, api_client, file_path, pg_name, positionX, positionY):
-
-    process_group = get_process_group(pg_name)
-    if process_group:
-        print(f"ERROR: {pg_name} progress group already exists. Manually delete it and try again.")
-        sys.exit(1)
-
-    # File to upload
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
+    fname = os.path.basename(file_path)
+    digest = flow_hash(file_path)
 
-    fname = file_path.split('/')[1]
+    process_group = get_top_level_group(pg_name)
+    if process_group:
+        if not sync:
+            raise RuntimeError(f"{pg_name} progress group already exists. Manually delete it and try again.")
+        deployed = deployed_flow_hash(process_group)
+        if deployed == digest:
+            print(f"{pg_name} is up to date with {fname}, skipping.")
+            return 'unchanged'
+        if deployed is None and not replace_unmarked:
+            print(f"{pg_name} has no recorded flow hash, so it may have been changed on the canvas; skipping. "
+                  f"Delete it or pass --replace-unmarked to import {fname}.")
+            return 'skipped'
+        print(f"{pg_name} differs from {fname}, replacing it.")
+        positionX, positionY = process_group.position.x, process_group.position.y
+        canvas.delete_process_group(process_group, force=True)
 
-    # Set up form data and headers
-    files = {'file': (fname, file_data, 'application/json')}
-    headers = {
-        'Accept': 'application/json, text/plain, */*',
-        'Authorization': api_client.default_headers['Authorization'],
-    }
     form_data = {
         'id': 'root',
         'groupName': pg_name,
@@ -273,31 +169,128 @@ def upload_flow_definition(nifi_host, api_client, file_path, pg_name, positionX,
         'clientId': 'xxxxx',
         'disconnectedNodeAcknowledged': 'false'
     }
+    with MultipartFileBody(form_data, 'file', file_path) as body:
+        headers = {
+            'Accept': 'application/json, text/plain, */*',
+            'Content-Type': body.content_type,
+        }
+
+        # Upload file to NiFi. The body can only be sent once, but the token
+        # was already checked (and refreshed if needed) by the lookup above.
+        response = client.request('POST', '/process-groups/root/process-groups/upload',
+                                  retry=False, headers=headers, data=body)
 
-    # Upload file to NiFi
-    url = f'{nifi_host}/process-groups/root/process-groups/upload'
-    response = requests.post(url, headers=headers, files=files, data=form_data, verify=False)
+    if response.status_code not in [200, 201]:
+        raise RuntimeError(f"Could not upload {fname} as {pg_name}: {response.status_code} {response.text}")
 
-    # Log response status
-    print(response.status_code)
-    # print(response.text)
+    record_flow_hash(response.json()['id'], fname, digest)
+    return 'replaced' if process_group else 'created'
+
+# Flow definitions uploaded at once
+UPLOAD_WORKERS = 4
+
+def is_flow_definition(file_path):
+    """True for a flow definition exported from NiFi, which has 'flowContents'."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            definition = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(definition, dict) and 'flowContents' in definition
+
+def load_flows(path):
+    """
+    List the flow definitions to import from a manifest or a directory.
+
+    A manifest is a JSON list of {"file", "name", "position": {"x", "y"}}
+    entries, with files relative to the manifest. For a directory every
+    *.json file that is a flow definition (not e.g. a manifest or update
+    plan) is imported as a Process Group named after the file, stacked
+    down the canvas.
+
+    Returns:
+        list[dict]: 'file', 'name' and 'position' of each flow
+    """
+    if os.path.isdir(path):
+        files = sorted(f for f in glob.glob(os.path.join(path, '*.json')) if is_flow_definition(f))
+        return [
+            {'file': f, 'name': os.path.splitext(os.path.basename(f))[0], 'position': {'x': 100, 'y': 100 + 200 * i}}
+            for i, f in enumerate(files)
+        ]
+    with open(path, 'r', encoding='utf-8') as f:
+        flows = json.load(f)
+    for flow in flows:
+        flow['file'] = os.path.join(os.path.dirname(os.path.abspath(path)), flow['file'])
+    return flows
+
+def import_flows(client, flows, sync=False, replace_unmarked=False, max_workers=UPLOAD_WORKERS):
+    """
+    Upload flow definitions concurrently and print how long each took.
+
+    Returns:
+        (bool): True if every flow was imported (or already up to date)
+    """
+    def timed_upload(flow):
+        start = time.monotonic()
+        try:
+            result = upload_flow_definition(client, flow['file'], flow['name'],
+                                            flow['position']['x'], flow['position']['y'], sync,
+                                            replace_unmarked)
+        except Exception as e:
+            print(f"ERROR: {e}")
+            result = 'failed'
+        return result, time.monotonic() - start
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = list(pool.map(timed_upload, flows))
+    elapsed = time.monotonic() - start
+
+    for flow, (result, seconds) in zip(flows, results):
+        print(f"{flow['name']} ({os.path.basename(flow['file'])}): {result} in {seconds:.1f}s")
+    counts = {}
+    for result, _ in results:
+        counts[result] = counts.get(result, 0) + 1
+    print(f"Imported {len(flows)} flows in {elapsed:.1f}s: "
+          + ", ".join(f"{n} {result}" for result, n in sorted(counts.items())))
+    return 'failed' not in counts
+
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Import the demo flow definitions into NiFi.")
+    parser.add_argument("--flows", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows.json"),
+                        help="Manifest of flow definitions, or a directory of them (default: flows.json next to "
+                             "this script)")
+    parser.add_argument("--sync", action="store_true",
+                        help="Skip flows whose Process Group was imported from an identical definition and "
+                             "replace those that changed, instead of failing if a group already exists")
+    parser.add_argument("--replace-unmarked", action="store_true",
+                        help="With --sync, also replace groups that have no recorded flow hash, e.g. created "
+                             "by hand or by an older version of this script, instead of skipping them")
+    parser.add_argument("--workers", type=int, default=UPLOAD_WORKERS,
+                        help=f"Flow definitions uploaded at once (default: {UPLOAD_WORKERS})")
+    return parser.parse_args()
 
 def main():
 
+    args = parse_arguments()
+
     DOCKER_HOST_OR_IP = os.getenv("DOCKER_HOST_OR_IP")
 
     nifi_host = f'https://{DOCKER_HOST_OR_IP}:18443/nifi-api'
     username = 'admin'
     password = '123456123456'
 
+    flows = load_flows(args.flows)
+
     # Set up NiFi connection
-    api_client = setup_nifi_connection(nifi_host, username, password)
+    client = NiFiClient(nifi_host, username, password)
 
-    root_pg_id = get_root_pg_id(api_client)
+    root_pg_id = get_root_pg_id(client.api_client)
     print(f'Root process group ID: {root_pg_id}')
 
-    upload_flow_definition(nifi_host, api_client, '/app/NiFi_Flow.json', 'Demo_Flow', 100, 100)
-    upload_flow_definition(nifi_host, api_client, '/app/NiFi_Waterlevel_Flow.json', 'Waterlevel_Flow', 100, 300)
+    if not import_flows(client, flows, args.sync, args.replace_unmarked, args.workers):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,321 @@
+"""
+Authenticated connection to the NiFi REST API, shared by import_flow.py,
+update_variables.py and the container healthcheck, and a concurrent walk
+of the canvas for both scripts.
+
+NiFiClient logs in once and caches the bearer token on disk until shortly
+before it expires, so consecutive scripts (and every healthcheck run)
+reuse it instead of calling POST /access/token each time. The nipyapi
+ApiClient and the requests session used for raw REST calls share one
+urllib3 pool of keep-alive connections, sized for the concurrent callers
+in these scripts. Both log in again and retry once when NiFi answers 401,
+e.g. because the cached token was revoked by a restart.
+"""
+import base64
+import hashlib
+import json
+import os
+import ssl
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+import nipyapi
+from nipyapi.nifi.api_client import ApiClient
+from nipyapi import config
+
+# Disable SSL warnings
+requests.packages.urllib3.disable_warnings()
+
+# Keep-alive connections to NiFi. Larger than the thread pools in
+# recurse_flow and apply_update_plan so concurrent calls never have to
+# open (and then discard) connections beyond the pool.
+POOL_MAXSIZE = 16
+
+# Per user, so other local users can't read or plant tokens
+TOKEN_CACHE = os.getenv("NIFI_TOKEN_CACHE", os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "nifi-token-cache.json"))
+TOKEN_EXPIRY_MARGIN = 60  # Seconds before expiry at which a cached token is no longer used
+TOKEN_DEFAULT_LIFETIME = 3600  # Used if a token carries no expiry claim
+
+class SSLAdapter(HTTPAdapter):
+    """Custom adapter to handle SSL without certificate verification."""
+    def init_poolmanager(self, connections, maxsize, block=False):
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        self.poolmanager = PoolManager(
+            num_pools=connections,
+            maxsize=maxsize,
+            block=block,
+            ssl_version=ssl.PROTOCOL_TLS,
+            ssl_context=context
+        )
+
+def token_expiry(token):
+    """Return the expiry of a JWT access token in epoch seconds, or None if it can't be read."""
+    try:
+        payload = token.split('.')[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+        return float(claims['exp'])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+class TokenCache:
+    """
+    Bearer tokens on disk, keyed by NiFi URL and user name, readable only
+    by the current user. A cache file owned by another user is ignored.
+
+    Args:
+        path (str): the cache file, defaults to $NIFI_TOKEN_CACHE or
+            nifi-token-cache.json in $XDG_CACHE_HOME or ~/.cache
+    """
+    def __init__(self, path=TOKEN_CACHE):
+        self.path = path
+
+    @staticmethod
+    def _key(host_url, username):
+        return hashlib.sha256(f"{host_url}|{username}".encode()).hexdigest()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                if os.fstat(f.fileno()).st_uid != os.getuid():
+                    return {}
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, host_url, username):
+        """Return a cached token that is still valid, or None."""
+        entry = self._load().get(self._key(host_url, username))
+        if entry and entry['expires'] - TOKEN_EXPIRY_MARGIN > time.time():
+            return entry['token']
+        return None
+
+    def _save(self, entries):
+        # Written to a new private temporary file (mkstemp creates it
+        # exclusively, mode 0600) and renamed, so concurrent scripts never
+        # read a partial cache
+        tmp_path = None
+        try:
+            cache_dir = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix='.nifi-token-cache.')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+        except OSError as e:
+            # Caching is an optimisation; carry on with the token in memory
+            print(f"Could not update NiFi token cache {self.path}: {e}")
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def put(self, host_url, username, token):
+        now = time.time()
+        entries = {k: v for k, v in self._load().items() if v['expires'] > now}
+        entries[self._key(host_url, username)] = {
+            'token': token,
+            'expires': token_expiry(token) or now + TOKEN_DEFAULT_LIFETIME,
+        }
+        self._save(entries)
+
+    def clear(self, host_url, username):
+        entries = self._load()
+        if entries.pop(self._key(host_url, username), None) is not None:
+            self._save(entries)
+
+class RefreshingApiClient(ApiClient):
+    """ApiClient that asks its NiFiClient for a new token and retries once on 401."""
+    nifi_client = None
+
+    def call_api(self, *args, **kwargs):
+        authorization = self.default_headers.get('Authorization')
+        try:
+            return super().call_api(*args, **kwargs)
+        except nipyapi.nifi.rest.ApiException as e:
+            if e.status != 401 or self.nifi_client is None:
+                raise
+        self.nifi_client.refresh(authorization)
+        return super().call_api(*args, **kwargs)
+
+class NiFiClient:
+    """
+    Authenticated NiFi connection for nipyapi and raw REST calls.
+
+    Args:
+        host_url (str): NiFi API URL, e.g. https://host:18443/nifi-api
+        username (str): NiFi user
+        password (str): password of the user
+        pool_maxsize (int): keep-alive connections to NiFi
+        token_cache (TokenCache): where tokens are cached, None to always
+            log in
+    """
+    def __init__(self, host_url, username, password, pool_maxsize=POOL_MAXSIZE, token_cache=TokenCache()):
+        self.host_url = host_url
+        self.username = username
+        self.password = password
+        self.token_cache = token_cache
+        self.token = None
+        self.lock = threading.Lock()
+
+        self.adapter = SSLAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+
+        # Create custom session with SSL adapter
+        self.session = requests.Session()
+        self.session.verify = False
+        self.session.mount('https://', self.adapter)
+
+        # Create API client sharing the session's connection pool
+        self.api_client = RefreshingApiClient()
+        self.api_client.host = host_url
+        self.api_client.verify = False
+        self.api_client.rest_client.pool_manager = self.adapter.poolmanager
+        self.api_client.nifi_client = self
+
+        # Configure NiFi connection settings
+        config.nifi_config.api_client = self.api_client
+        config.nifi_config.host = host_url
+        config.nifi_config.verify_ssl = False
+
+        self.login()
+
+    def login(self, force=False):
+        """Use a cached token, unless `force` is set or there is none, else authenticate."""
+        token = None
+        if self.token_cache and not force:
+            token = self.token_cache.get(self.host_url, self.username)
+        if token:
+            self._set_token(token)
+            print("NiFi connection set up with a cached access token.")
+            return
+
+        try:
+            # Without the Authorization header of a stale token, which NiFi would reject
+            response = self.session.post(
+                f"{self.host_url}/access/token",
+                data={"username": self.username, "password": self.password},
+                headers={"Authorization": None}
+            )
+
+            if response.status_code not in [200, 201]:
+                raise Exception(f"Authentication failed with status code {response.status_code}")
+
+            token = response.text.strip()  # Strip any whitespace
+            if not token:
+                raise Exception("No access token found in response.")
+        except Exception as e:
+            print(f"Authentication error: {str(e)}")
+            raise
+
+        if self.token_cache:
+            self.token_cache.put(self.host_url, self.username, token)
+        self._set_token(token)
+        print("NiFi connection successfully set up with authentication.")
+
+    def _set_token(self, token):
+        self.token = token
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.api_client.default_headers['Authorization'] = f'Bearer {token}'
+
+        # Transfer cookies to NiFi configuration and the ApiClient
+        config.nifi_config.cookies = self.session.cookies
+        for cookie in self.session.cookies:
+            self.api_client.set_default_header("Cookie", f"{cookie.name}={cookie.value}")
+
+    def refresh(self, authorization):
+        """
+        Log in again after a 401 for a request sent with `authorization`,
+        unless another thread already replaced that token.
+        """
+        with self.lock:
+            if authorization == f"Bearer {self.token}":
+                if self.token_cache:
+                    self.token_cache.clear(self.host_url, self.username)
+                self.login(force=True)
+
+    def request(self, method, path, retry=True, **kwargs):
+        """
+        Send a request to `path` under the API URL over the shared session,
+        logging in again and retrying once on 401.
+
+        Args:
+            method (str): HTTP method
+            path (str): path below the API URL, e.g. /flow/about
+            retry (bool): False for bodies that can only be sent once,
+                such as generators
+            kwargs: passed on to requests
+
+        Returns:
+            (requests.Response)
+        """
+        authorization = self.session.headers.get("Authorization")
+        response = self.session.request(method, f"{self.host_url}{path}", **kwargs)
+        if response.status_code == 401 and retry:
+            self.refresh(authorization)
+            response = self.session.request(method, f"{self.host_url}{path}", **kwargs)
+        return response
+
+def get_flow(pg_id='root'):
+    """
+    Returns information about a Process Group and flow.
+
+    This surfaces the native implementation, for the recursed implementation
+    see 'recurse_flow'
+
+    Args:
+        pg_id (str): id of the Process Group to retrieve, defaults to the root
+            process group if not set
+
+    Returns:
+         (ProcessGroupFlowEntity): The Process Group object
+    """
+    assert isinstance(pg_id, str), "pg_id should be a string"
+    with nipyapi.utils.rest_exceptions():
+        return nipyapi.nifi.FlowApi().get_flow(pg_id)
+
+
+# Concurrent get_flow calls in recurse_flow. Kept below NiFiClient's pool
+# size so every request reuses a pooled connection.
+RECURSE_FLOW_WORKERS = 8
+
+def recurse_flow(pg_id='root', max_workers=RECURSE_FLOW_WORKERS):
+    """
+    Returns information about a Process Group and all its Child Flows.
+    Recurses the child flows by appending each process group with a
+    'nipyapi_extended' parameter which contains the child process groups, etc.
+    Note: This previously used actual recursion which broke on large NiFi
+        environments, we now use a task/list update approach. Child flows
+        are fetched concurrently on a bounded thread pool: the children of
+        each Process Group are submitted as soon as its own flow arrives.
+
+    Args:
+        pg_id (str): The Process Group UUID
+        max_workers (int): get_flow calls in flight at once
+
+    Returns:
+         (ProcessGroupFlowEntity): enriched NiFi Flow object
+    """
+    assert isinstance(pg_id, str), "pg_id should be a string"
+
+    out = get_flow(pg_id)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        tasks = {pool.submit(get_flow, x.id): x for x in out.process_group_flow.flow.process_groups}
+        while tasks:
+            done, _ = wait(tasks, return_when=FIRST_COMPLETED)
+            for future in done:
+                this_parent_obj = tasks.pop(future)
+                this_flow = future.result()
+                this_parent_obj.__setattr__(
+                    'nipyapi_extended',
+                    this_flow
+                )
+                tasks.update((pool.submit(get_flow, x.id), x) for x in
+                             this_flow.process_group_flow.flow.process_groups)
+    return out
@@ -0,0 +1,265 @@
+"""
+Sweep the scheduling settings of ingest processors (e.g. PutVastDB and
+ConsumeKafka) and report the configuration with the highest throughput.
+
+Every combination of concurrent tasks, run duration and, optionally, a
+batch size property is applied to the chosen processors in turn; after
+each change the flowfiles/sec of the measured processors is read from
+NiFi's processor status. NiFi reports status over a rolling 5 minutes, so
+each setting is held for --settle seconds plus that window before it is
+measured: a sweep takes about 5-6 minutes per combination (use --dry-run
+to see the plan). The original settings are restored afterwards, unless
+--keep-best is given.
+
+With DOCKER_HOST_OR_IP exported and data flowing into the flow:
+
+    python3 tune_processors.py --processors PutVastDB --concurrent-tasks 1 2 4 8 --run-duration-ms 0 25 100
+    python3 tune_processors.py --processors "ConsumeKafka - streaming-demo" PutVastDB --measure PutVastDB \\
+        --batch-property "ConsumeKafka - streaming-demo=max.poll.records" --batch-sizes 500 2000 10000
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import nipyapi
+
+from nifi_client import NiFiClient
+from update_variables import CanvasIndex, update_processor
+
+# NiFi processor status counts flowfiles and bytes over a rolling 5 minutes
+STATUS_WINDOW_SECONDS = 300
+
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Find the fastest concurrency, run duration and batch size for NiFi processors.")
+    parser.add_argument("--processors", nargs="+", required=True,
+                        help="Exact names of the processors to tune; every processor with the name is tuned")
+    parser.add_argument("--measure", nargs="+",
+                        help="Processors whose combined flowfiles/sec is maximised (default: the tuned processors)")
+    parser.add_argument("--concurrent-tasks", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Concurrent task counts to try (default: 1 2 4 8)")
+    parser.add_argument("--run-duration-ms", type=int, nargs="+", default=[0, 25, 100],
+                        help="Run durations in milliseconds to try (default: 0 25 100)")
+    parser.add_argument("--batch-property", action="append", default=[], metavar="PROCESSOR=PROPERTY",
+                        help="Property of a tuned processor that sets its batch size, e.g. "
+                             "'ConsumeKafka - streaming-demo=max.poll.records'; repeatable")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[],
+                        help="Values to try for the batch properties")
+    parser.add_argument("--settle", type=int, default=30,
+                        help=f"Seconds to wait after a change, on top of the {STATUS_WINDOW_SECONDS}s status window (default: 30)")
+    parser.add_argument("--keep-best", action="store_true",
+                        help="Leave the best configuration applied instead of restoring the original settings")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the settings that would be tried and the expected duration, then exit")
+    parser.add_argument("--output", metavar="DIR",
+                        help="Write a JSON summary of the sweep into DIR")
+    args = parser.parse_args()
+
+    args.measure = args.measure or args.processors
+    batch_properties = {}
+    for spec in args.batch_property:
+        name, sep, prop = spec.partition('=')
+        if not sep or not prop or name not in args.processors:
+            parser.error(f"--batch-property {spec!r} must be PROCESSOR=PROPERTY for one of --processors")
+        batch_properties[name] = prop
+    args.batch_property = batch_properties
+    if bool(args.batch_property) != bool(args.batch_sizes):
+        parser.error("--batch-property and --batch-sizes must be given together")
+    if min(args.concurrent_tasks) < 1 or min(args.run_duration_ms) < 0 or min(args.batch_sizes, default=1) < 1:
+        parser.error("--concurrent-tasks and --batch-sizes must be positive and --run-duration-ms not negative")
+    return args
+
+def sweep_settings(concurrent_tasks, run_durations, batch_sizes):
+    """Every combination of the values to try, as dicts."""
+    return [
+        {'concurrent_tasks': tasks, 'run_duration_ms': duration, 'batch_size': batch}
+        for tasks, duration, batch in itertools.product(concurrent_tasks, run_durations, batch_sizes or [None])
+    ]
+
+def find_processors(canvas_index, names):
+    """
+    Return {name: [ProcessorEntity]} for processors matching each name
+    exactly, exiting if a name matches nothing.
+    """
+    out = {}
+    for name in names:
+        found = canvas_index.processor(name, greedy=False)
+        if not found:
+            print(f"Processor {name} not found")
+            sys.exit(1)
+        out[name] = found if isinstance(found, list) else [found]
+    return out
+
+def current_setting(entity, batch_property):
+    """The part of a processor's configuration that the sweep changes."""
+    config = entity.component.config
+    return {
+        'state': entity.component.state,
+        'concurrent_tasks': config.concurrently_schedulable_task_count,
+        'run_duration_ms': config.run_duration_millis,
+        'batch_size': (config.properties or {}).get(batch_property) if batch_property else None,
+    }
+
+def configure_processor(api_client, processor_id, setting, batch_property, state='RUNNING'):
+    """
+    Stop a processor, apply `setting` and bring it back to `state`. NiFi
+    rejects configuration changes to a running processor.
+
+    Args:
+        api_client (ApiClient): authenticated client from NiFiClient
+        processor_id (str): the processor to change
+        setting (dict): 'concurrent_tasks', 'run_duration_ms' and
+            'batch_size'
+        batch_property (str): the processor's batch size property, or None
+            to leave its properties alone
+        state (str): run state afterwards: 'RUNNING', 'STOPPED' or 'DISABLED'
+
+    Returns:
+        (ProcessorEntity): the reconfigured processor
+    """
+    processors_api = nipyapi.nifi.ProcessorsApi(api_client)
+    nipyapi.canvas.schedule_processor(processors_api.get_processor(processor_id), False)
+
+    update = nipyapi.nifi.ProcessorConfigDTO(
+        concurrently_schedulable_task_count=setting['concurrent_tasks'],
+        run_duration_millis=setting['run_duration_ms'],
+    )
+    if batch_property:
+        # None removes a property that was unset before the sweep
+        batch_size = setting['batch_size']
+        update.properties = {batch_property: None if batch_size is None else str(batch_size)}
+    # Re-read for the revision left by stopping it
+    processor = update_processor(api_client, processors_api.get_processor(processor_id), update)
+
+    if state != 'STOPPED':
+        nipyapi.canvas.schedule_processor(processor, state)
+    return processor
+
+def throughput(api_client, processor_ids):
+    """
+    Combined flowfiles/sec and bytes/sec of processors over the status
+    window. Sinks such as PutVastDB are counted by what they take in,
+    sources such as ConsumeKafka by what they send out.
+    """
+    flowfiles = size = 0
+    for processor_id in processor_ids:
+        snapshot = nipyapi.nifi.FlowApi(api_client).get_processor_status(processor_id).processor_status.aggregate_snapshot
+        flowfiles += max(snapshot.flow_files_in, snapshot.flow_files_out)
+        size += max(snapshot.bytes_in, snapshot.bytes_out)
+    return flowfiles / STATUS_WINDOW_SECONDS, size / STATUS_WINDOW_SECONDS
+
+def format_setting(setting):
+    text = f"tasks={setting['concurrent_tasks']} run_duration={setting['run_duration_ms']}ms"
+    if setting['batch_size'] is not None:
+        text += f" batch={setting['batch_size']}"
+    return text
+
+def run_sweep(api_client, targets, measured_ids, settings, batch_properties, settle):
+    """
+    Apply each setting to every target processor, wait for it to fill the
+    status window and measure throughput.
+
+    Args:
+        targets (dict): {name: [ProcessorEntity]} of processors to tune
+        measured_ids (list[str]): processors whose throughput is summed
+        settings (list[dict]): from sweep_settings
+        batch_properties (dict): {name: property} batch size property per
+            tuned processor name
+        settle (int): seconds to wait on top of the status window
+
+    Returns:
+        list[dict]: each setting with its 'flowfiles_per_sec' and 'bytes_per_sec'
+    """
+    results = []
+    for n, setting in enumerate(settings, 1):
+        for name, entities in targets.items():
+            for entity in entities:
+                configure_processor(api_client, entity.id, setting, batch_properties.get(name))
+        print(f"[{n}/{len(settings)}] {format_setting(setting)}: measuring for "
+              f"{settle + STATUS_WINDOW_SECONDS}s", flush=True)
+        time.sleep(settle + STATUS_WINDOW_SECONDS)
+        flowfiles_per_sec, bytes_per_sec = throughput(api_client, measured_ids)
+        print(f"[{n}/{len(settings)}] {format_setting(setting)}: "
+              f"{flowfiles_per_sec:,.1f} flowfiles/s, {bytes_per_sec / 1e6:,.2f} MB/s", flush=True)
+        results.append(dict(setting, flowfiles_per_sec=flowfiles_per_sec, bytes_per_sec=bytes_per_sec))
+    return results
+
+def main():
+
+    args = parse_arguments()
+    settings = sweep_settings(args.concurrent_tasks, args.run_duration_ms, args.batch_sizes)
+    duration = len(settings) * (args.settle + STATUS_WINDOW_SECONDS)
+    print(f"{len(settings)} settings to try, about {duration / 60:.0f} minutes")
+    if args.dry_run:
+        for setting in settings:
+            print(f"  {format_setting(setting)}")
+        return
+
+    DOCKER_HOST_OR_IP = os.getenv("DOCKER_HOST_OR_IP")
+
+    nifi_host = f'https://{DOCKER_HOST_OR_IP}:18443/nifi-api'
+    username = 'admin'
+    password = '123456123456'
+
+    # Set up NiFi connection
+    client = NiFiClient(nifi_host, username, password)
+    api_client = client.api_client
+
+    canvas_index = CanvasIndex(api_client)
+    targets = find_processors(canvas_index, args.processors)
+    measured_ids = [e.id for entities in find_processors(canvas_index, args.measure).values() for e in entities]
+    original = {
+        entity.id: (name, current_setting(entity, args.batch_property.get(name)))
+        for name, entities in targets.items() for entity in entities
+    }
+
+    results = []
+    best = None
+    try:
+        results = run_sweep(api_client, targets, measured_ids, settings, args.batch_property, args.settle)
+    except KeyboardInterrupt:
+        print("Sweep interrupted")
+    finally:
+        if results:
+            best = max(results, key=lambda r: r['flowfiles_per_sec'])
+        for processor_id, (name, setting) in original.items():
+            batch_property = args.batch_property.get(name)
+            if args.keep_best and best:
+                configure_processor(api_client, processor_id, best, batch_property, setting['state'])
+            else:
+                configure_processor(api_client, processor_id, setting, batch_property, setting['state'])
+        print("Best settings applied." if args.keep_best and best else "Original settings restored.")
+
+    if not results:
+        sys.exit(1)
+
+    print(f"\n{'tasks':>6} {'run ms':>7} {'batch':>7} {'flowfiles/s':>12} {'MB/s':>8}")
+    for r in sorted(results, key=lambda r: r['flowfiles_per_sec'], reverse=True):
+        batch = '-' if r['batch_size'] is None else r['batch_size']
+        print(f"{r['concurrent_tasks']:>6} {r['run_duration_ms']:>7} {batch:>7} "
+              f"{r['flowfiles_per_sec']:>12,.1f} {r['bytes_per_sec'] / 1e6:>8.2f}")
+    print(f"Best: {format_setting(best)} at {best['flowfiles_per_sec']:,.1f} flowfiles/s "
+          f"measured at {', '.join(args.measure)}")
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        started = datetime.datetime.now()
+        path = os.path.join(args.output, f"tune-{started:%Y%m%dT%H%M%S}.json")
+        summary = {
+            'timestamp': started.isoformat(timespec='seconds'),
+            'host': platform.node(),
+            'config': vars(args),
+            'original': {processor_id: dict(setting, name=name) for processor_id, (name, setting) in original.items()},
+            'results': results,
+            'best': best,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print(f"Tuning summary written to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,22 @@
+import argparse
 import os
-import ssl
+import string
 import sys
 import json
+import time
 import logging
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.poolmanager import PoolManager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import nipyapi
 from nipyapi.nifi import ParameterProviderEntity, ParameterProviderDTO
-from nipyapi.nifi.api_client import ApiClient
 from nipyapi.nifi.apis.controller_api import ControllerApi
 from nipyapi.nifi.apis.flow_api import FlowApi
-from nipyapi.nifi.apis.access_api import AccessApi
 from nipyapi import canvas, config
 from nipyapi.nifi.models.process_group_entity import ProcessGroupEntity
 from nipyapi.nifi.models.process_group_dto import ProcessGroupDTO
 from nipyapi.nifi.apis.process_groups_api import ProcessGroupsApi
 import six
 
-# Disable SSL warnings
-requests.packages.urllib3.disable_warnings()
+from nifi_client import NiFiClient, recurse_flow
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR)
@@ -28,77 +25,6 @@ urllib3_logger.setLevel(logging.ERROR)
 nipyapi_logger = logging.getLogger("nipyapi")
 nipyapi_logger.setLevel(logging.ERROR)
 
-class SSLAdapter(HTTPAdapter):
-    """Custom adapter to handle SSL without certificate verification."""
-    def init_poolmanager(self, connections, maxsize, block=False):
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        self.poolmanager = PoolManager(
-            num_pools=connections,
-            maxsize=maxsize,
-            block=block,
-            ssl_version=ssl.PROTOCOL_TLS,
-            ssl_context=context
-        )
-
-def setup_nifi_connection(host_url, username, password):
-    """
-    Set up NiFi connection with proper SSL configuration and authentication.
-    """
-    adapter = SSLAdapter()
-
-    # Create custom session with SSL adapter
-    session = requests.Session()
-    session.verify = False
-    session.mount('https://', adapter)
-
-    # Create API client and configure authentication
-    api_client = ApiClient()
-    api_client.host = host_url
-    api_client.verify = False
-    api_client.rest_client.pool_manager = adapter.poolmanager
-
-    # Configure NiFi connection settings
-    access_api = AccessApi(api_client)
-    config.nifi_config.api_client = api_client
-    config.nifi_config.host = host_url
-    config.nifi_config.verify_ssl = False
-
-    try:
-        # Authenticate and get access token
-        response = session.post(
-            f"{host_url}/access/token",
-            data={"username": username, "password": password}
-        )
-
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Authentication failed with status code {response.status_code}")
-
-        access_token = response.text.strip()  # Strip any whitespace
-        if not access_token:
-            raise Exception("No access token found in response.")
-
-        # Set authorization headers
-        session.headers.update({"Authorization": f"Bearer {access_token}"})
-
-        # Transfer cookies to NiFi configuration
-        config.nifi_config.cookies = session.cookies
-
-        # Set the Authorization header on ApiClient
-        api_client.default_headers['Authorization'] = f'Bearer {access_token}'
-
-        # Transfer cookies from session to ApiClient
-        for cookie in session.cookies:
-            api_client.set_default_header("Cookie", f"{cookie.name}={cookie.value}")
-
-        print("NiFi connection successfully set up with authentication.")
-        return api_client
-
-    except Exception as e:
-        print(f"Authentication error: {str(e)}")
-        raise
-
 def list_all_controllers(pg_id='root', descendants=True):
     """
     Lists all controllers under a given Process Group, defaults to Root
@@ -397,60 +323,287 @@ def get_process_group(identifier, identifier_type='name', greedy=True):
     return out
 
 
-def get_flow(pg_id='root'):
+class CanvasIndex:
     """
-    Returns information about a Process Group and flow.
+    Name and id lookups for the Process Groups, Processors and Controller
+    Services on the canvas, built from a single walk of the flow.
 
-    This surfaces the native implementation, for the recursed implementation
-    see 'recurse_flow'
+    The get_* functions above list the whole canvas again for every lookup
+    by name (one get_flow call per Process Group each time); the index
+    walks it once with recurse_flow and fetches controller services with
+    one descendant query, then serves every lookup from memory.
 
-    Args:
-        pg_id (str): id of the Process Group to retrieve, defaults to the root
-            process group if not set
+    Entities are cached with the revision they were read at. Pass the
+    entity returned by an update to `refresh` so later updates of the same
+    component send its new revision, or call `invalidate` after changes the
+    index can't see (e.g. components added or removed) to rebuild it on the
+    next lookup.
 
-    Returns:
-         (ProcessGroupFlowEntity): The Process Group object
+    Args:
+        api_client (ApiClient): authenticated client from NiFiClient
+        pg_id (str): Process Group to index, defaults to the Canvas root
     """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
-    with nipyapi.utils.rest_exceptions():
-        return nipyapi.nifi.FlowApi().get_flow(pg_id)
+    KINDS = ['process_groups', 'processors', 'controllers']
+
+    def __init__(self, api_client, pg_id='root'):
+        self.api_client = api_client
+        self.pg_id = pg_id
+        self.by_id = None
+        self.by_name = None
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on the next lookup."""
+        self.by_id = None
+        self.by_name = None
+
+    def build(self):
+        """Walk the canvas and index every component by id and by name."""
+        self.by_id = {kind: {} for kind in self.KINDS}
+        self.by_name = {kind: {} for kind in self.KINDS}
+
+        root_flow = recurse_flow(self.pg_id)
+        root_entity = nipyapi.nifi.ProcessGroupsApi(self.api_client).get_process_group(self.pg_id)
+        root_entity.__setattr__('nipyapi_extended', root_flow)
+        self._add('process_groups', root_entity)
+
+        flows = [root_flow]
+        while flows:
+            flow = flows.pop().process_group_flow.flow
+            for pg in flow.process_groups:
+                self._add('process_groups', pg)
+                flows.append(pg.nipyapi_extended)
+            for processor in flow.processors:
+                self._add('processors', processor)
+
+        controllers = nipyapi.nifi.FlowApi(self.api_client).get_controller_services_from_group(
+            root_entity.id, include_descendant_groups=True).controller_services
+        for controller in controllers:
+            self._add('controllers', controller)
+
+        print(f"Indexed {len(self.by_id['process_groups'])} process groups, "
+              f"{len(self.by_id['processors'])} processors and "
+              f"{len(self.by_id['controllers'])} controller services.")
+
+    def _add(self, kind, entity):
+        self.by_id[kind][entity.id] = entity
+        self.by_name[kind].setdefault(entity.component.name, []).append(entity)
+
+    def refresh(self, entity):
+        """Replace the cached copy of an updated component with `entity`."""
+        for kind in self.KINDS:
+            old = self.by_id[kind].get(entity.id) if self.by_id else None
+            if old is None:
+                continue
+            self.by_id[kind][entity.id] = entity
+            same_name = self.by_name[kind][old.component.name]
+            same_name.remove(old)
+            if not same_name:
+                del self.by_name[kind][old.component.name]
+            self.by_name[kind].setdefault(entity.component.name, []).append(entity)
+            return
+
+    def find(self, kind, identifier, identifier_type='name', greedy=True):
+        """
+        Look up components of one kind in the index.
+
+        Args:
+            kind (str): one of KINDS
+            identifier (str): the id or name to look for
+            identifier_type (str): 'id' or 'name'
+            greedy (bool): for names, True for partial match, False for
+                exact match
+
+        Returns:
+            None for no matches, Single Object for unique match,
+            list(Objects) for multiple matches, as nipyapi.utils.filter_obj
+        """
+        assert kind in self.KINDS
+        assert identifier_type in ['name', 'id']
+        if self.by_id is None:
+            self.build()
+        if identifier_type == 'id':
+            return self.by_id[kind].get(identifier)
+        if greedy:
+            out = [e for name, entities in self.by_name[kind].items() if identifier in name for e in entities]
+        else:
+            out = list(self.by_name[kind].get(identifier, []))
+        if not out:
+            return None
+        return out if len(out) > 1 else out[0]
+
+    def process_group(self, identifier, identifier_type='name', greedy=True):
+        return self.find('process_groups', identifier, identifier_type, greedy)
+
+    def processor(self, identifier, identifier_type='name', greedy=True):
+        return self.find('processors', identifier, identifier_type, greedy)
+
+    def controller(self, identifier, identifier_type='name', greedy=True):
+        return self.find('controllers', identifier, identifier_type, greedy)
 
+# Component updates in flight at once when applying an update plan
+UPDATE_WORKERS = 8
 
-def recurse_flow(pg_id='root'):
+# Update plan component types and the CanvasIndex kind they are found in
+PLAN_TYPES = {'controller': 'controllers', 'processor': 'processors'}
+
+def load_update_plan(path):
     """
-    Returns information about a Process Group and all its Child Flows.
-    Recurses the child flows by appending each process group with a
-    'nipyapi_extended' parameter which contains the child process groups, etc.
-    Note: This previously used actual recursion which broke on large NiFi
-        environments, we now use a task/list update approach
+    Load an update plan: a JSON list of steps, each with the component
+    'type' ('controller' or 'processor'), its 'name', the 'properties' to
+    set and optionally 'greedy' (false for an exact name match, default
+    true) and 'optional' (true if it may be missing from the canvas).
+    ${VAR} references in property values are filled in from the
+    environment.
 
     Args:
-        pg_id (str): The Process Group UUID
+        path (str): the plan file
 
     Returns:
-         (ProcessGroupFlowEntity): enriched NiFi Flow object
+        list[dict]: the plan steps with properties resolved
     """
-    assert isinstance(pg_id, six.string_types), "pg_id should be a string"
+    with open(path, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    for step in plan:
+        assert step['type'] in PLAN_TYPES, f"Unknown component type {step['type']} in {path}"
+        try:
+            step['properties'] = {
+                key: string.Template(value).substitute(os.environ) if isinstance(value, str) else value
+                for key, value in step['properties'].items()
+            }
+        except KeyError as e:
+            print(f"Environment variable {e.args[0]} used by {step['name']} in {path} is not set.")
+            sys.exit(1)
+    return plan
+
+def is_revision_conflict(e):
+    """
+    True if a failed update was rejected because the component changed
+    since it was read. NiFi answers a stale revision with a 400 that names
+    the revision; a 409 is a state conflict, e.g. an enabled controller
+    service or a running processor, which a retry can't resolve.
+    """
+    cause = e if isinstance(e, nipyapi.nifi.rest.ApiException) else e.__cause__
+    if not isinstance(cause, nipyapi.nifi.rest.ApiException):
+        return False
+    body = cause.body.decode() if isinstance(cause.body, bytes) else str(cause.body)
+    return cause.status == 400 and 'revision' in body.lower()
+
+def current_properties(component_type, entity):
+    if component_type == 'controller':
+        return entity.component.properties or {}
+    return entity.component.config.properties or {}
+
+# How NiFi returns the value of a sensitive property that is set
+SENSITIVE_MASK = '********'
+
+def sensitive_properties(component_type, entity):
+    """Names of the properties NiFi returns masked, so their values can't be compared."""
+    if component_type == 'controller':
+        descriptors = entity.component.descriptors or {}
+    else:
+        descriptors = entity.component.config.descriptors or {}
+    return {name for name, descriptor in descriptors.items() if getattr(descriptor, 'sensitive', False)}
+
+def needs_update(component_type, entity, properties):
+    """True if a planned property differs from the component's, or is sensitive and so can't be checked."""
+    current = current_properties(component_type, entity)
+    sensitive = sensitive_properties(component_type, entity)
+    return any(
+        key in sensitive or current.get(key) == SENSITIVE_MASK or current.get(key) != value
+        for key, value in properties.items()
+    )
 
-    out = get_flow(pg_id)
-    tasks = [(x.id, x) for x in out.process_group_flow.flow.process_groups]
-    while tasks:
-        this_pg_id, this_parent_obj = tasks.pop()
-        this_flow = get_flow(this_pg_id)
-        this_parent_obj.__setattr__(
-            'nipyapi_extended',
-            this_flow
-        )
-        tasks += [(x.id, x) for x in
-                  this_flow.process_group_flow.flow.process_groups]
-    return out
+def apply_update(api_client, component_type, entity, properties, retries=3):
+    """
+    Set `properties` on a controller service or processor, re-reading it
+    and retrying if the update is rejected for a stale revision.
 
-def enable_controller_services(nifi_host, api_client, pg_id):
+    Returns:
+        (ControllerServiceEntity or ProcessorEntity): the updated component
+    """
+    for attempt in range(retries + 1):
+        try:
+            if component_type == 'controller':
+                return update_controller(entity, nipyapi.nifi.ControllerServiceDTO(properties=properties))
+            return update_processor(api_client, entity, nipyapi.nifi.ProcessorConfigDTO(properties=properties))
+        except (nipyapi.nifi.rest.ApiException, ValueError) as e:
+            if attempt == retries or not is_revision_conflict(e):
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+            if component_type == 'controller':
+                entity = nipyapi.nifi.ControllerServicesApi(api_client).get_controller_service(entity.id)
+            else:
+                entity = nipyapi.nifi.ProcessorsApi(api_client).get_processor(entity.id)
+
+def apply_update_plan(api_client, plan, canvas_index, max_workers=UPDATE_WORKERS):
+    """
+    Resolve every step of an update plan against the canvas index, then
+    update the matching components concurrently. Components matched by
+    more than one step get the properties of all of them in one update.
+    Components whose properties already have the planned values are left
+    alone. Sensitive properties are masked by NiFi and can't be compared,
+    so components with a planned sensitive property are always updated.
+
+    Args:
+        api_client (ApiClient): authenticated client from NiFiClient
+        plan (list[dict]): steps from load_update_plan
+        canvas_index (CanvasIndex): index to resolve names against, refreshed
+            with the updated components
+        max_workers (int): updates in flight at once
+
+    Returns:
+        (bool): True if every required component was found and updated
+    """
+    start = time.monotonic()
+    targets = {}
+    missing = []
+    for step in plan:
+        found = canvas_index.find(PLAN_TYPES[step['type']], step['name'], greedy=step.get('greedy', True))
+        if not found:
+            if not step.get('optional', False):
+                missing.append(step['name'])
+            print(f"{step['type'].capitalize()} {step['name']} not found")
+            continue
+        for entity in found if isinstance(found, list) else [found]:
+            target = targets.setdefault(entity.id, {'type': step['type'], 'entity': entity, 'properties': {}})
+            target['properties'].update(step['properties'])
+
+    updates = []
+    for target in targets.values():
+        if needs_update(target['type'], target['entity'], target['properties']):
+            updates.append(target)
+    unchanged = len(targets) - len(updates)
+
+    changed = failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(apply_update, api_client, target['type'], target['entity'], target['properties']): target
+            for target in updates
+        }
+        for future in as_completed(futures):
+            target = futures[future]
+            entity = target['entity']
+            try:
+                updated = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Could not update {target['type']} {entity.component.name} {entity.id}: {e}")
+                continue
+            changed += 1
+            canvas_index.refresh(updated)
+            print(f"Updated {target['type']} {entity.component.name} {entity.id}: "
+                  f"{', '.join(target['properties'])}")
+
+    print(f"Update plan applied in {time.monotonic() - start:.1f}s: {changed} changed (including any with "
+          f"sensitive properties, which are always sent), {unchanged} unchanged, {failed} failed, "
+          f"{len(missing)} not found")
+    return not failed and not missing
+
+def enable_controller_services(client, pg_id):
 
     # Set up form data and headers
     headers = {
         'Accept': 'application/json, text/plain, */*',
-        'Authorization': api_client.default_headers['Authorization'],
         'Content-Type': 'application/json'
     }
     form_data = {
@@ -459,8 +612,8 @@ def enable_controller_services(nifi_host, api_client, pg_id):
         "disconnectedNodeAcknowledged":False
     }
 
-    url = f'{nifi_host}/flow/process-groups/{pg_id}/controller-services'
-    response = requests.put(url, headers=headers, data=json.dumps(form_data), verify=False)
+    path = f'/flow/process-groups/{pg_id}/controller-services'
+    response = client.request('PUT', path, headers=headers, data=json.dumps(form_data))
 
     # Log response status
     print(response.status_code)
@@ -468,242 +621,56 @@ def enable_controller_services(nifi_host, api_client, pg_id):
         print("Controller services enabled.")
     else:
         print("Could not enable controller services.")
-        print(url)
+        print(path)
         print(response.text)
         sys.exit(1)
 
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Configure the NiFi demo flows for this environment.")
+    parser.add_argument("--plan", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "update_plan.json"),
+                        help="Update plan to apply (default: update_plan.json next to this script)")
+    parser.add_argument("--workers", type=int, default=UPDATE_WORKERS,
+                        help=f"Component updates in flight at once (default: {UPDATE_WORKERS})")
+    return parser.parse_args()
+
 def main():
 
+    args = parse_arguments()
+
     DOCKER_HOST_OR_IP = os.getenv("DOCKER_HOST_OR_IP")
-    
-    VASTDB_ENDPOINT = os.getenv("VASTDB_ENDPOINT")
-    VASTDB_ACCESS_KEY = os.getenv("VASTDB_ACCESS_KEY")
-    VASTDB_SECRET_KEY = os.getenv("VASTDB_SECRET_KEY")
-    VASTDB_TWITTER_INGEST_BUCKET = os.getenv("VASTDB_TWITTER_INGEST_BUCKET")
-    VASTDB_TWITTER_INGEST_SCHEMA = os.getenv("VASTDB_TWITTER_INGEST_SCHEMA")
-    VASTDB_TWITTER_INGEST_TABLE = os.getenv("VASTDB_TWITTER_INGEST_TABLE")
-    VASTDB_BULK_IMPORT_BUCKET = os.getenv("VASTDB_BULK_IMPORT_BUCKET")
-    VASTDB_BULK_IMPORT_SCHEMA = os.getenv("VASTDB_BULK_IMPORT_SCHEMA")
-    VASTDB_BULK_IMPORT_TABLE = os.getenv("VASTDB_BULK_IMPORT_TABLE")
-    VASTDB_WATERLEVEL_BUCKET = os.getenv("VASTDB_WATERLEVEL_BUCKET")
-    VASTDB_WATERLEVEL_SCHEMA = os.getenv("VASTDB_WATERLEVEL_SCHEMA")
-    VAST_KAFKA_BROKER = os.getenv("VAST_KAFKA_BROKER")
-    
-    S3A_ENDPOINT = os.getenv("S3A_ENDPOINT")
-    S3A_ACCESS_KEY = os.getenv("S3A_ACCESS_KEY")
-    S3A_SECRET_KEY = os.getenv("S3A_SECRET_KEY")
-    S3A_BUCKET = os.getenv("S3A_BUCKET")
 
     nifi_host = f'https://{DOCKER_HOST_OR_IP}:18443/nifi-api'
     username = 'admin'
     password = '123456123456'
 
-    # Set up NiFi connection
-    api_client = setup_nifi_connection(nifi_host, username, password)
-
-    ###############
-    # S3 Controller
-    ###############
-
-    update=nipyapi.nifi.ControllerServiceDTO(
-                properties={
-                    'Access Key': S3A_ACCESS_KEY,
-                    'Secret Key': S3A_SECRET_KEY
-                }
-            )
-    controller = get_controller(api_client, 'S3A - AWSCredentialsProviderControllerService')
-    if isinstance(controller, list):
-        for c in controller:
-            print(f'Updating S3A - AWSCredentialsProviderControllerService controller {c.id} {update}')
-            updated = update_controller(c, update)
-    else:
-        print(f'Updating S3A - AWSCredentialsProviderControllerService controller {controller.id} {update}')
-        updated = update_controller(controller, update)
-
-    ###################
-    # VastDB Controller
-    ###################
-
-    update=nipyapi.nifi.ControllerServiceDTO(
-                properties={
-                    'Access Key': VASTDB_ACCESS_KEY,
-                    'Secret Key': VASTDB_SECRET_KEY
-                }
-            )
-    controller = get_controller(api_client, 'VastDB - AWSCredentialsProviderControllerService')
-    if isinstance(controller, list):
-        for c in controller:
-            print(f'Updating VastDB - AWSCredentialsProviderControllerService controller {c.id} {update}')
-            updated = update_controller(c, update)
-    else:
-        print(f'Updating S3A - VastDB - AWSCredentialsProviderControllerService controller {controller.id} {update}')
-        updated = update_controller(controller, update)
-
-
-    ##################
-    # Kafka Controller
-    ##################
-
-    update=nipyapi.nifi.ControllerServiceDTO(
-                properties={
-                    'bootstrap.servers': VAST_KAFKA_BROKER
-                }
-            )
-    controller = get_controller(api_client, 'Kafka3ConnectionService')
-    if isinstance(controller, list):
-        for c in controller:
-            print(f'Updating Kafka3ConnectionService process {c.id} {update}')
-            updated = update_controller(c, update)
-    else:
-        print(f'Updating Kafka3ConnectionService process {controller.id} {update}')
-        updated = update_controller(controller, update)
-
+    plan = load_update_plan(args.plan)
 
-    #####################
-    # PutVastDB Processor
-    #####################
+    # Set up NiFi connection
+    client = NiFiClient(nifi_host, username, password)
+    api_client = client.api_client
 
-    update=nipyapi.nifi.ProcessorConfigDTO(
-                properties={
-                    'VastDB Endpoint': VASTDB_ENDPOINT,
-                    'VastDB Bucket': VASTDB_TWITTER_INGEST_BUCKET,
-                    'VastDB Database Schema': VASTDB_TWITTER_INGEST_SCHEMA,
-                    'VastDB Table Name': VASTDB_TWITTER_INGEST_TABLE
-                }
-            )
-    processor = get_processor(api_client, 'PutVastDB', greedy=False)
-    # there are multiple PutVastDB processors
-    for p in processor:
-        print(f'Updating PutVasDB process {p.id} {update}')
-        updated = update_processor(api_client, p, update)
-
-    ########################
-    # ImportVastDB Processor
-    ########################
-
-    update=nipyapi.nifi.ProcessorConfigDTO(
-                properties={
-                    'VastDB Endpoint': f'{VASTDB_ENDPOINT}',
-                    'VastDB Bucket': VASTDB_BULK_IMPORT_BUCKET,
-                    'VastDB Database Schema': VASTDB_BULK_IMPORT_SCHEMA,
-                    'VastDB Table Name': VASTDB_BULK_IMPORT_TABLE
-                }
-            )
-    processor = get_processor(api_client, 'ImportVastDB')
-    if isinstance(processor, list):
-        for p in processor:
-            print(f'Updating ImportVastDB process {p.id} {update}')
-            updated = update_processor(api_client, p, update)
-    else:
-        print(f'Updating ImportVastDB process {processor.id} {update}')
-        updated = update_processor(api_client, processor, update)
-
-    ##################
-    # ListS3 Processor
-    ##################
-
-    update=nipyapi.nifi.ProcessorConfigDTO(
-                properties={
-                    'Endpoint Override URL': f'{S3A_ENDPOINT}',
-                    'Bucket': f'{S3A_BUCKET}'
-                }
-            )
-    processor = get_processor(api_client, 'ListS3')
-    if isinstance(processor, list):
-        for p in processor:
-            print(f'Updating ListS3 process {p.id} {update}')
-            updated = update_processor(api_client, p, update)
-    else:
-        print(f'Updating ListS3 process {processor.id} {update}')
-        updated = update_processor(api_client, processor, update)
+    # Walk the canvas once and serve every lookup below from the index
+    canvas_index = CanvasIndex(api_client)
 
     ###################################################################################################
-    # Weather Flow
+    # Controller and processor properties
     ###################################################################################################
 
-    ###################
-    # AWS Controller Service
-    ###################
-
-    update=nipyapi.nifi.ControllerServiceDTO(
-                properties={
-                    'Access Key': VASTDB_ACCESS_KEY,
-                    'Secret Key': VASTDB_SECRET_KEY
-                }
-            )
-    controller = get_controller(api_client, 'Weather-AWSCredentialsProviderControllerService')
-    if isinstance(controller, list):
-        for c in controller:
-            print(f'Updating Weather-AWSCredentialsProviderControllerService controller {c.id} {update}')
-            updated = update_controller(c, update)
-    else:
-        print(f'Updating S3A - Weather-AWSCredentialsProviderControllerService controller {controller.id} {update}')
-        updated = update_controller(controller, update)
-
-    #####################
-    # PutVastDB-Weather-Waterstations Processor
-    #####################
-
-    update=nipyapi.nifi.ProcessorConfigDTO(
-                properties={
-                    'VastDB Endpoint': VASTDB_ENDPOINT,
-                    'VastDB Bucket': VASTDB_WATERLEVEL_BUCKET,
-                    'VastDB Database Schema': VASTDB_WATERLEVEL_SCHEMA,
-                    'VastDB Table Name': 'waterstations'
-                }
-            )
-    processor = get_processor(api_client, 'PutVastDB-Weather-Waterstations', greedy=False)
-    # there are multiple PutVastDB processors
-    if not processor:
-        print(f'Processor PutVastDB-Weather-Waterstations not Found')
+    if not apply_update_plan(api_client, plan, canvas_index, args.workers):
         sys.exit(1)
-    elif isinstance(processor, list):
-        for p in processor:
-            print(f'Updating PutVastDB-Weather-Waterstations process {p.id} {update}')
-            updated = update_processor(api_client, p, update)
-    else:
-        print(f'Updating PutVastDB-Weather-Waterstations process {p.id} {update}')
-        updated = update_processor(api_client, processor, update)
-
-
-
-    #####################
-    # PutVastDB-Weather-Watermeasures Processor
-    #####################
-
-    update=nipyapi.nifi.ProcessorConfigDTO(
-                properties={
-                    'VastDB Endpoint': VASTDB_ENDPOINT,
-                    'VastDB Bucket': VASTDB_WATERLEVEL_BUCKET,
-                    'VastDB Database Schema': VASTDB_WATERLEVEL_SCHEMA,
-                    'VastDB Table Name': 'watermeasures'
-                }
-            )
-    processor = get_processor(api_client, 'PutVastDB-Weather-Watermeasures', greedy=False)
-    # there are multiple PutVastDB processors
-    if not processor:
-        print(f'Processor PutVastDB-Weather-Watermeasures not Found')
-        sys.exit(1)
-    elif isinstance(processor, list):
-        for p in processor:
-            print(f'Updating PutVastDB-Weather-Watermeasures process {p.id} {update}')
-            updated = update_processor(api_client, p, update)
-    else:
-        print(f'Updating PutVastDB-Weather-Watermeasures process {p.id} {update}')
-        updated = update_processor(api_client, processor, update)
-
 
     ###################################################################################################
     # Enable all controller services
     ###################################################################################################
 
     pg_name = "Demo_Flow"
-    process_group = get_process_group(pg_name)
-    enable_controller_services(nifi_host, api_client, process_group.id)
+    process_group = canvas_index.process_group(pg_name)
+    enable_controller_services(client, process_group.id)
 
     pg_name = "Waterlevel_Flow"
-    process_group = get_process_group(pg_name)
-    enable_controller_services(nifi_host, api_client, process_group.id)
-        
+    process_group = canvas_index.process_group(pg_name)
+    enable_controller_services(client, process_group.id)
+
 if __name__ == "__main__":
     main()
@@ -1,16 +1,16 @@
-import ssl
+import argparse
+import contextlib
+import json
 import logging
 import os
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.poolmanager import PoolManager
+import sys
+import time
 import nipyapi
-from nipyapi.nifi.api_client import ApiClient
-from nipyapi.nifi.apis.access_api import AccessApi
-from nipyapi import config
 
-# Disable SSL warnings
-requests.packages.urllib3.disable_warnings()
+# nifi_client.py is mounted next to this script in the NiFi container, and
+# lives in assets/ when run from a checkout
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets'))
+from nifi_client import NiFiClient
 
 # Configure logging
 logging.basicConfig(level=logging.ERROR)
@@ -19,86 +19,207 @@ urllib3_logger.setLevel(logging.ERROR)
 nipyapi_logger = logging.getLogger("nipyapi")
 nipyapi_logger.setLevel(logging.ERROR)
 
-class SSLAdapter(HTTPAdapter):
-    """Custom adapter to handle SSL without certificate verification."""
-    def init_poolmanager(self, connections, maxsize, block=False):
-        context = ssl.create_default_context()
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
-        self.poolmanager = PoolManager(
-            num_pools=connections,
-            maxsize=maxsize,
-            block=block,
-            ssl_version=ssl.PROTOCOL_TLS,
-            ssl_context=context
-        )
-
-def setup_nifi_connection(host_url, username, password):
-
-    adapter = SSLAdapter()
-
-    # Create custom session with SSL adapter
-    session = requests.Session()
-    session.verify = False
-    session.mount('https://', adapter)
-
-    # Create API client and configure authentication
-    api_client = ApiClient()
-    api_client.host = host_url
-    api_client.verify = False
-    api_client.rest_client.pool_manager = adapter.poolmanager
-
-    # Configure NiFi connection settings
-    access_api = AccessApi(api_client)
-    config.nifi_config.api_client = api_client
-    config.nifi_config.host = host_url
-    config.nifi_config.verify_ssl = False
-
-    try:
-        # Authenticate and get access token
-        response = session.post(
-            f"{host_url}/access/token",
-            data={"username": username, "password": password}
-        )
-
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Authentication failed with status code {response.status_code}")
-
-        access_token = response.text.strip()  # Strip any whitespace
-        if not access_token:
-            raise Exception("No access token found in response.")
-
-        # Set authorization headers
-        session.headers.update({"Authorization": f"Bearer {access_token}"})
-
-        # Transfer cookies to NiFi configuration
-        config.nifi_config.cookies = session.cookies
-
-        # Set the Authorization header on ApiClient
-        api_client.default_headers['Authorization'] = f'Bearer {access_token}'
-
-        # Transfer cookies from session to ApiClient
-        for cookie in session.cookies:
-            api_client.set_default_header("Cookie", f"{cookie.name}={cookie.value}")
-
-        print("NiFi connection successfully set up with authentication.")
-        return api_client
-
-    except Exception as e:
-        print(f"Authentication error: {str(e)}")
-        raise
+# NiFi status snapshots count flowfiles and bytes over a rolling 5 minutes
+STATUS_WINDOW_SECONDS = 300
+
+MONITORED_GROUPS = ['Demo_Flow', 'Waterlevel_Flow']
+
+def find_groups(api_client, names):
+    """Return {name: id} for the Process Groups directly under root with the given names."""
+    groups = nipyapi.nifi.ProcessGroupsApi(api_client).get_process_groups('root').process_groups
+    return {pg.component.name: pg.id for pg in groups if pg.component.name in names}
+
+def walk_group_status(snapshot, path):
+    """
+    Yield (group path, snapshot) for a Process Group status snapshot and
+    all of its descendants.
+    """
+    yield path, snapshot
+    for child in snapshot.process_group_status_snapshots or []:
+        child_snapshot = child.process_group_status_snapshot
+        yield from walk_group_status(child_snapshot, f"{path}/{child_snapshot.name}")
+
+def collect_metrics(api_client, group_names):
+    """
+    Poll processor and connection status for the named Process Groups and
+    the JVM diagnostics.
+
+    Returns:
+        (dict): 'timestamp', 'jvm', 'processors', 'connections' and
+            'backpressured', the connections that are at their threshold
+    """
+    processors = []
+    connections = []
+    for name, pg_id in find_groups(api_client, group_names).items():
+        status = nipyapi.nifi.FlowApi(api_client).get_process_group_status(pg_id, recursive=True)
+        for path, group in walk_group_status(status.process_group_status.aggregate_snapshot, name):
+            for entity in group.processor_status_snapshots or []:
+                p = entity.processor_status_snapshot
+                processors.append({
+                    'group': path,
+                    'processor': p.name,
+                    'type': p.type,
+                    'id': p.id,
+                    'run_status': p.run_status,
+                    'flowfiles_in_per_sec': p.flow_files_in / STATUS_WINDOW_SECONDS,
+                    'flowfiles_out_per_sec': p.flow_files_out / STATUS_WINDOW_SECONDS,
+                    'bytes_in_per_sec': p.bytes_in / STATUS_WINDOW_SECONDS,
+                    'bytes_out_per_sec': p.bytes_out / STATUS_WINDOW_SECONDS,
+                    'bytes_written_per_sec': p.bytes_written / STATUS_WINDOW_SECONDS,
+                    'active_threads': p.active_thread_count,
+                    'tasks_per_sec': p.task_count / STATUS_WINDOW_SECONDS,
+                })
+            for entity in group.connection_status_snapshots or []:
+                c = entity.connection_status_snapshot
+                connections.append({
+                    'group': path,
+                    'connection': c.name or f"{c.source_name} -> {c.destination_name}",
+                    'id': c.id,
+                    'source': c.source_name,
+                    'destination': c.destination_name,
+                    'queued_flowfiles': c.flow_files_queued,
+                    'queued_bytes': c.bytes_queued,
+                    'percent_use_count': c.percent_use_count,
+                    'percent_use_bytes': c.percent_use_bytes,
+                    'backpressure': max(c.percent_use_count or 0, c.percent_use_bytes or 0) >= 100,
+                })
+
+    diag = nipyapi.nifi.SystemDiagnosticsApi(api_client).get_system_diagnostics().system_diagnostics.aggregate_snapshot
+    return {
+        'timestamp': time.time(),
+        'jvm': {
+            'heap_used_bytes': diag.used_heap_bytes,
+            'heap_max_bytes': diag.max_heap_bytes,
+            'threads': diag.total_threads,
+            'daemon_threads': diag.daemon_threads,
+            'load_average': diag.processor_load_average,
+        },
+        'processors': processors,
+        'connections': connections,
+        # The destination of a full queue is the component that can't keep up
+        'backpressured': [f"{c['group']}: {c['source']} -> {c['destination']}"
+                          for c in connections if c['backpressure']],
+    }
+
+PROCESSOR_METRICS = [
+    ('flowfiles_in_per_sec', 'nifi_processor_flowfiles_in_per_second', 'FlowFiles received per second (5 minute average)'),
+    ('flowfiles_out_per_sec', 'nifi_processor_flowfiles_out_per_second', 'FlowFiles sent per second (5 minute average)'),
+    ('bytes_in_per_sec', 'nifi_processor_bytes_in_per_second', 'Bytes received per second (5 minute average)'),
+    ('bytes_out_per_sec', 'nifi_processor_bytes_out_per_second', 'Bytes sent per second (5 minute average)'),
+    ('bytes_written_per_sec', 'nifi_processor_bytes_written_per_second', 'Bytes written per second (5 minute average)'),
+    ('active_threads', 'nifi_processor_active_threads', 'Threads currently running the processor'),
+    ('tasks_per_sec', 'nifi_processor_tasks_per_second', 'Tasks completed per second (5 minute average)'),
+]
+
+CONNECTION_METRICS = [
+    ('queued_flowfiles', 'nifi_connection_queued_flowfiles', 'FlowFiles queued in the connection'),
+    ('queued_bytes', 'nifi_connection_queued_bytes', 'Bytes queued in the connection'),
+    ('percent_use_count', 'nifi_connection_backpressure_count_percent', 'Queued FlowFiles as a percentage of the back pressure threshold'),
+    ('percent_use_bytes', 'nifi_connection_backpressure_bytes_percent', 'Queued bytes as a percentage of the back pressure threshold'),
+    ('backpressure', 'nifi_connection_backpressure', '1 if back pressure is being applied to the source'),
+]
+
+JVM_METRICS = [
+    ('heap_used_bytes', 'nifi_jvm_heap_used_bytes', 'JVM heap in use'),
+    ('heap_max_bytes', 'nifi_jvm_heap_max_bytes', 'Maximum JVM heap'),
+    ('threads', 'nifi_jvm_threads', 'JVM threads'),
+    ('daemon_threads', 'nifi_jvm_daemon_threads', 'JVM daemon threads'),
+    ('load_average', 'nifi_system_load_average', 'System load average'),
+]
+
+def prometheus_labels(labels):
+    escaped = {k: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for k, v in labels.items()}
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped.items()) + '}'
+
+def format_prometheus(metrics):
+    """Render collected metrics in the Prometheus text exposition format."""
+    lines = []
+
+    def add(rows, definitions, label_keys):
+        for key, name, help_text in definitions:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for row in rows:
+                if row[key] is not None:
+                    lines.append(f"{name}{prometheus_labels({k: row[k] for k in label_keys})} {float(row[key])}")
+
+    add(metrics['processors'], PROCESSOR_METRICS, ['group', 'processor', 'id'])
+    add(metrics['connections'], CONNECTION_METRICS, ['group', 'connection', 'source', 'destination', 'id'])
+    for key, name, help_text in JVM_METRICS:
+        if metrics['jvm'][key] is not None:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {float(metrics['jvm'][key])}"]
+    return '\n'.join(lines) + '\n'
+
+def write_output(text, path, append):
+    """Write to stdout, or to `path`: appended, or replaced atomically for scrapers."""
+    if not path:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    elif append:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(f"{path}.tmp", path)
+
+def monitor(api_client, group_names, output_format, interval, count, path):
+    """Poll and print metrics every `interval` seconds, `count` times or until interrupted."""
+    polls = 0
+    while count is None or polls < count:
+        start = time.monotonic()
+        metrics = collect_metrics(api_client, group_names)
+        if output_format == 'json':
+            write_output(json.dumps(metrics) + '\n', path, append=True)
+        else:
+            write_output(format_prometheus(metrics), path, append=False)
+        for connection in metrics['backpressured']:
+            print(f"Back pressure: {connection}", file=sys.stderr)
+        polls += 1
+        if count is None or polls < count:
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+def parse_arguments():
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(description="Check that NiFi is up, or monitor flow throughput and back pressure.")
+    parser.add_argument("--monitor", action="store_true",
+                        help="Poll processor, connection and JVM metrics instead of a single health check")
+    parser.add_argument("--groups", nargs="+", default=MONITORED_GROUPS,
+                        help=f"Top-level Process Groups to monitor (default: {' '.join(MONITORED_GROUPS)})")
+    parser.add_argument("--format", choices=['prometheus', 'json'], default='prometheus',
+                        help="Prometheus text, or one JSON object per poll (default: prometheus)")
+    parser.add_argument("--interval", type=float, default=15.0,
+                        help="Seconds between polls (default: 15)")
+    parser.add_argument("--count", type=int, default=None,
+                        help="Stop after this many polls (default: run until interrupted)")
+    parser.add_argument("--output", metavar="FILE",
+                        help="Write metrics to FILE instead of stdout: replaced on each poll for prometheus "
+                             "(e.g. for the node_exporter textfile collector), appended for json")
+    return parser.parse_args()
 
 def main():
 
+    args = parse_arguments()
+
     DOCKER_HOST_OR_IP = os.getenv("DOCKER_HOST_OR_IP")
 
     nifi_host = f'https://{DOCKER_HOST_OR_IP}:18443/nifi-api'
     username = 'admin'
     password = '123456123456'
 
-    # Set up NiFi connection
-    api_client = setup_nifi_connection(nifi_host, username, password)
-    diag = nipyapi.nifi.SystemDiagnosticsApi(api_client).get_system_diagnostics()
+    if not args.monitor:
+        # Set up NiFi connection
+        client = NiFiClient(nifi_host, username, password)
+        diag = nipyapi.nifi.SystemDiagnosticsApi(client.api_client).get_system_diagnostics()
+        return
+
+    # Keep connection messages out of the metrics on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        client = NiFiClient(nifi_host, username, password)
+    try:
+        monitor(client.api_client, args.groups, args.format, args.interval, args.count, args.output)
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == "__main__":
     main()
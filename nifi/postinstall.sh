@@ -57,6 +57,6 @@ docker run --rm \
     pip install --no-cache-dir --no-warn-script-location --disable-pip-version-check --quiet nipyapi six && \
 
     # Run the Python script to set up the database connections with the optional --force-delete flag
-    python3 /app/import_flow.py
+    python3 /app/import_flow.py --sync
     python3 /app/update_variables.py
   "
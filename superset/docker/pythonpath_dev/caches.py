@@ -0,0 +1,79 @@
+#
+# Flask-Caching backend for the Redis caches in superset_config.py.
+#
+# Each cache has its own Redis database, but the caches on one server share
+# its maxmemory, so one oversized entry could evict thousands of small ones.
+# LimitedRedisCache skips entries above a size limit, given as
+# CACHE_OPTIONS = {"max_entry_bytes": ...}; Superset then recomputes them
+# on the next request instead of reading them from the cache.
+#
+import logging
+
+from flask_caching.backends.rediscache import RedisCache
+
+logger = logging.getLogger(__name__)
+
+
+class LimitedRedisCache(RedisCache):
+    """
+    Flask-Caching RedisCache that doesn't store entries above a size.
+
+    Args:
+        max_entry_bytes (int): size of the serialized entry from which it
+            is not stored, None for no limit
+        **kwargs: passed on to RedisCache
+    """
+
+    def __init__(self, max_entry_bytes=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_entry_bytes = max_entry_bytes
+
+    def _too_large(self, key, dump):
+        if self.max_entry_bytes and len(dump) >= self.max_entry_bytes:
+            logger.info(
+                "Not caching %s: %d bytes is over the %d byte limit",
+                key, len(dump), self.max_entry_bytes,
+            )
+            return True
+        return False
+
+    def set(self, key, value, timeout=None):
+        dump = self.serializer.dumps(value)
+        if self._too_large(key, dump):
+            return False
+        # As RedisCache.set, without serializing the value again
+        timeout = self._normalize_timeout(timeout)
+        name = self._get_prefix() + key
+        if timeout == -1:
+            return self._write_client.set(name=name, value=dump)
+        return self._write_client.setex(name=name, value=dump, time=timeout)
+
+    def add(self, key, value, timeout=None):
+        dump = self.serializer.dumps(value)
+        if self._too_large(key, dump):
+            return False
+        # As RedisCache.add
+        timeout = self._normalize_timeout(timeout)
+        name = self._get_prefix() + key
+        created = self._write_client.setnx(name=name, value=dump)
+        if created and timeout != -1:
+            self._write_client.expire(name=name, time=timeout)
+        return created
+
+    def set_many(self, mapping, timeout=None):
+        # As RedisCache.set_many, leaving out the entries over the limit
+        timeout = self._normalize_timeout(timeout)
+        pipe = self._write_client.pipeline(transaction=False)
+        keys = []
+        for key, value in mapping.items():
+            dump = self.serializer.dumps(value)
+            if self._too_large(key, dump):
+                continue
+            keys.append(key)
+            name = self._get_prefix() + key
+            if timeout == -1:
+                pipe.set(name=name, value=dump)
+            else:
+                pipe.setex(name=name, value=dump, time=timeout)
+        results = pipe.execute()
+        return [key for key, was_set in zip(keys, results) if was_set]
@@ -0,0 +1,200 @@
+#
+# Rollup tables for the time series charts of the VastDB dashboards.
+#
+# "Flows per Min", "Measurements per Hour" and "Trades per Day" would otherwise
+# aggregate the full raw tables through Trino on every refresh. The
+# rollups.refresh Celery task keeps a per minute/hour/day summary table next to
+# each raw table up to date and then re-runs the charts built on it, so their
+# cache is refreshed before it expires. It is scheduled in
+# CeleryConfig.beat_schedule in superset_config.py.
+#
+# Each refresh recomputes the buckets from the newest one in the rollup table,
+# less `lookback`, onwards, so late rows within the lookback are picked up;
+# older late rows are not. The first refresh creates and fills the table.
+# Buckets are deleted and re-inserted without a transaction, so a chart query
+# that runs in between sees the recent buckets missing.
+#
+# Source and rollup tables are looked up by dataset uuid (see
+# superset/templates), so they follow the VASTDB_* variables the datasets were
+# imported with.
+#
+from datetime import date, timedelta
+import logging
+
+from celery.utils.log import get_task_logger
+
+from superset import app, db, security_manager
+from superset.commands.chart.warm_up_cache import ChartWarmUpCacheCommand
+from superset.connectors.sqla.models import SqlaTable
+from superset.extensions import celery_app
+from superset.models.slice import Slice
+from superset.utils.core import override_user
+
+logger = get_task_logger(__name__)
+logger.setLevel(logging.INFO)
+
+# {source} is the raw dataset's table and {schema} its schema, {target} the
+# rollup table and {since} a predicate on the raw rows from the cutoff on.
+ROLLUPS = {
+    "netflow_per_minute": {
+        "source_dataset": "8447662b-57ea-467a-9afd-cb967431493f",  # netflow
+        "dataset": "1a77f6a7-e89e-457a-9f76-9b152d2cef2b",
+        "bucket": "timestamp",
+        "bucket_type": "timestamp",
+        "lookback": timedelta(minutes=2),
+        "create": """
+            CREATE TABLE IF NOT EXISTS {target} (
+                "timestamp" TIMESTAMP(3), flows BIGINT, bytes_sent BIGINT, packets BIGINT
+            )""",
+        "insert": """
+            INSERT INTO {target}
+            SELECT date_trunc('minute', "timestamp"), count(*), sum(bytes_sent), sum(packets)
+            FROM {source}
+            WHERE {since}
+            GROUP BY 1""",
+        "since": '"timestamp" >= {cutoff}',
+    },
+    "waterlevel_per_hour": {
+        "source_dataset": "ae62c956-81ad-4dc4-b1ec-923f3537bec2",  # water_analysis
+        "dataset": "35d84596-ae53-4a7e-8408-28cf05df0483",
+        "bucket": "timestamp",
+        "bucket_type": "timestamp",
+        "lookback": timedelta(hours=3),
+        "create": """
+            CREATE TABLE IF NOT EXISTS {target} (
+                "timestamp" TIMESTAMP(0), station_uuid VARCHAR, readings BIGINT,
+                measurements BIGINT, value_sum DOUBLE
+            )""",
+        # The same join as the water_analysis dataset
+        "insert": """
+            INSERT INTO {target}
+            SELECT date_trunc('hour', t."timestamp"), t.station_uuid, count(*), count(t.value), sum(t.value)
+            FROM "{schema}".waterstations s
+            JOIN "{schema}".watermeasures t ON s.uuid = t.station_uuid
+            WHERE {since}
+            GROUP BY 1, 2""",
+        "since": 't."timestamp" >= {cutoff}',
+    },
+    "fraud_trades_per_day": {
+        "source_dataset": "1b3133cf-11d8-4a12-aa73-d5c9e0464c8e",  # fraud
+        "dataset": "5ab0d45c-6cbc-4767-94c6-cc81209163cd",
+        "bucket": "trade_date",
+        "bucket_type": "date",
+        "lookback": timedelta(days=2),
+        "create": """
+            CREATE TABLE IF NOT EXISTS {target} (
+                trade_date VARCHAR, status VARCHAR, trades BIGINT, quantity BIGINT
+            )""",
+        "insert": """
+            INSERT INTO {target}
+            SELECT trade_date, status, count(*), sum(quantity)
+            FROM {source}
+            WHERE {since}
+            GROUP BY 1, 2""",
+        "since": "trade_date >= {cutoff}",
+    },
+}
+
+
+def get_dataset(uuid):
+    dataset = db.session.query(SqlaTable).filter_by(uuid=uuid).one_or_none()
+    if dataset is None:
+        raise ValueError(f"Dataset {uuid} has not been imported")
+    return dataset
+
+
+def cutoff_literal(watermark, rollup):
+    """SQL literal for the first bucket to recompute, given the newest one."""
+    if rollup["bucket_type"] == "date":
+        # ISO dates stored as VARCHAR compare in date order
+        cutoff = date.fromisoformat(str(watermark)[:10]) - rollup["lookback"]
+        return f"'{cutoff.isoformat()}'"
+    cutoff = watermark - rollup["lookback"]
+    return f"TIMESTAMP '{cutoff:%Y-%m-%d %H:%M:%S}'"
+
+
+def execute(conn, sql):
+    cursor = conn.cursor()
+    cursor.execute(sql)
+    # Trino only finishes a statement once its results are read
+    return cursor.fetchall()
+
+
+def refresh_table(name):
+    """
+    Bring a rollup table up to date with its source.
+
+    Returns:
+        (str): the cutoff the buckets were recomputed from, or None if the
+            table was filled from scratch
+    """
+    rollup = ROLLUPS[name]
+    source = get_dataset(rollup["source_dataset"])
+    target = get_dataset(rollup["dataset"])
+    target_name = f'"{target.schema}"."{target.table_name}"'
+    params = {
+        "source": f'"{source.schema}"."{source.table_name}"',
+        "schema": source.schema,
+        "target": target_name,
+    }
+
+    with target.database.get_raw_connection(schema=target.schema) as conn:
+        execute(conn, rollup["create"].format(**params))
+        watermark = execute(conn, f'SELECT max("{rollup["bucket"]}") FROM {target_name}')[0][0]
+        if watermark is None:
+            cutoff = None
+            since = "TRUE"
+        else:
+            cutoff = cutoff_literal(watermark, rollup)
+            since = rollup["since"].format(cutoff=cutoff)
+            execute(conn, f'DELETE FROM {target_name} WHERE "{rollup["bucket"]}" >= {cutoff}')
+        execute(conn, rollup["insert"].format(since=since, **params))
+    return cutoff
+
+
+def warm_up_charts(dataset):
+    """
+    Re-run the charts on a dataset, replacing their cached results. Charts
+    need a saved query context; import_assets.py restores those that the
+    dashboard import drops.
+
+    Returns:
+        (dict): {'success': [chart ids], 'errors': [chart ids]}
+    """
+    results = {"success": [], "errors": []}
+    user = security_manager.find_user(username=app.config["THUMBNAIL_SELENIUM_USER"])
+    charts = db.session.query(Slice).filter_by(datasource_type="table", datasource_id=dataset.id).all()
+    with override_user(user):
+        for chart in charts:
+            try:
+                result = ChartWarmUpCacheCommand(chart, None, None).run()
+                if result["viz_error"]:
+                    raise RuntimeError(result["viz_error"])
+                results["success"].append(chart.id)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.error("Failed to warm up chart %s (%s): %s", chart.id, chart.slice_name, ex)
+                results["errors"].append(chart.id)
+    return results
+
+
+@celery_app.task(name="rollups.refresh")
+def refresh(name):
+    """
+    Celery job to refresh a rollup table and warm up the charts on it.
+
+    Args:
+        name (str): a key of ROLLUPS
+    """
+    try:
+        cutoff = refresh_table(name)
+    except Exception as ex:  # pylint: disable=broad-except
+        logger.exception("Failed to refresh rollup %s", name)
+        return {"error": str(ex)}
+    logger.info("Refreshed rollup %s from %s", name, cutoff or "scratch")
+
+    results = warm_up_charts(get_dataset(ROLLUPS[name]["dataset"]))
+    logger.info(
+        "Warmed up %d charts on %s, %d failed",
+        len(results["success"]), name, len(results["errors"]),
+    )
+    return results
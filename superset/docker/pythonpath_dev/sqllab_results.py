@@ -0,0 +1,93 @@
+#
+# Redis results backend for async SQL Lab queries.
+#
+# Superset stores each result set as an Arrow table in MessagePack,
+# zlib-compressed (RESULTS_BACKEND_USE_MSGPACK), under a random key that
+# the browser fetches from. Kept in Redis rather than on a container's
+# disk, a result is readable from every web server and worker.
+#
+# Superset gives every entry the database's cache timeout, or
+# CACHE_DEFAULT_TIMEOUT (a day) if the database has none. Entries are kept
+# for that long, but at most `default_timeout`, and at most
+# `large_timeout` from `large_entry_bytes` on, so a few big result sets
+# don't hold memory for as long. Entries over `max_entry_bytes` are not
+# stored; the query then has to be re-run to see its results. Results are
+# kept in the Redis for chart data; when it reaches its maxmemory, it evicts
+# the least recently used results and chart data (see the redis-data service
+# in docker-compose.yml).
+#
+import logging
+import pickle
+
+from cachelib.redis import RedisCache
+from cachelib.serializers import RedisSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def is_zlib(value):
+    """
+    True if `value` starts with the zlib header written by zlib.compress:
+    CMF 0x78 (deflate, 32K window) and a FLG byte that makes
+    CMF * 256 + FLG a multiple of 31 (RFC 1950).
+    """
+    if len(value) < 2:
+        return False
+    cmf, flg = value[0], value[1]
+    return cmf == 0x78 and (cmf * 256 + flg) % 31 == 0
+
+
+class CompressedResultsSerializer(RedisSerializer):
+    """
+    Stores compressed results as they are instead of pickled; reading
+    them back needs no change, as RedisSerializer.loads returns values
+    that were not pickled unchanged.
+    """
+
+    def dumps(self, value, protocol=pickle.HIGHEST_PROTOCOL):
+        # zlib streams start with 0x78, never "!" or a digit
+        if isinstance(value, bytes) and is_zlib(value):
+            return value
+        return super().dumps(value, protocol)
+
+
+class SqlLabResultsCache(RedisCache):
+    """
+    RedisCache with timeouts by entry size.
+
+    Args:
+        default_timeout (int): seconds results are kept
+        large_entry_bytes (int): size from which `large_timeout` applies
+        large_timeout (int): seconds large results are kept
+        max_entry_bytes (int): size from which results are not stored
+        **kwargs: passed on to RedisCache (host, port, db, key_prefix, ...)
+    """
+
+    serializer = CompressedResultsSerializer()
+
+    def __init__(
+        self,
+        default_timeout=24 * 60 * 60,
+        large_entry_bytes=32 * 1024 * 1024,
+        large_timeout=60 * 60,
+        max_entry_bytes=256 * 1024 * 1024,
+        **kwargs,
+    ):
+        super().__init__(default_timeout=default_timeout, **kwargs)
+        self.large_entry_bytes = large_entry_bytes
+        self.large_timeout = large_timeout
+        self.max_entry_bytes = max_entry_bytes
+
+    def set(self, key, value, timeout=None):
+        # Superset passes the database's cache timeout; the size caps it.
+        # None and 0 (the cachelib default and "never expire") get the cap.
+        size = len(value) if isinstance(value, bytes) else 0
+        if size >= self.max_entry_bytes:
+            logger.warning(
+                "Not storing SQL Lab results %s: %d bytes compressed is over the %d byte limit",
+                key, size, self.max_entry_bytes,
+            )
+            return False
+        cap = self.large_timeout if size >= self.large_entry_bytes else self.default_timeout
+        timeout = min(timeout, cap) if timeout else cap
+        return super().set(key, value, timeout)
@@ -22,9 +22,11 @@
 #
 import logging
 import os
+from datetime import timedelta
 
 from celery.schedules import crontab
 from flask_caching.backends.filesystemcache import FileSystemCache
+from sqllab_results import SqlLabResultsCache
 
 logger = logging.getLogger()
 
@@ -58,18 +60,94 @@ REDIS_HOST = os.getenv("REDIS_HOST", "redis")
 REDIS_PORT = os.getenv("REDIS_PORT", "6379")
 REDIS_CELERY_DB = os.getenv("REDIS_CELERY_DB", "0")
 REDIS_RESULTS_DB = os.getenv("REDIS_RESULTS_DB", "1")
+REDIS_SQLLAB_RESULTS_DB = os.getenv("REDIS_SQLLAB_RESULTS_DB", "2")
+REDIS_CACHE_DB = os.getenv("REDIS_CACHE_DB", "3")
+REDIS_DATA_CACHE_DB = os.getenv("REDIS_DATA_CACHE_DB", "4")
+REDIS_STATE_CACHE_DB = os.getenv("REDIS_STATE_CACHE_DB", "5")
+REDIS_THUMBNAIL_CACHE_DB = os.getenv("REDIS_THUMBNAIL_CACHE_DB", "6")
+# Chart data, thumbnails and SQL Lab results, which can be recomputed, have
+# their own Redis so they can't evict metadata, state or the Celery queues
+REDIS_DATA_HOST = os.getenv("REDIS_DATA_HOST", "redis-data")
+REDIS_DATA_PORT = os.getenv("REDIS_DATA_PORT", "6379")
 
-RESULTS_BACKEND = FileSystemCache("/app/superset_home/sqllab")
+# Where async SQL Lab results are kept: "redis", readable from every
+# container (see sqllab_results.py), or "filesystem", on the disk of the
+# worker that ran the query
+SQLLAB_RESULTS_BACKEND = os.getenv("SQLLAB_RESULTS_BACKEND", "redis")
+if SQLLAB_RESULTS_BACKEND == "redis":
+    RESULTS_BACKEND = SqlLabResultsCache(
+        host=REDIS_DATA_HOST,
+        port=int(REDIS_DATA_PORT),
+        db=int(REDIS_SQLLAB_RESULTS_DB),
+        key_prefix="superset_results_",
+    )
+elif SQLLAB_RESULTS_BACKEND == "filesystem":
+    RESULTS_BACKEND = FileSystemCache("/app/superset_home/sqllab")
+else:
+    raise ValueError(
+        f"SQLLAB_RESULTS_BACKEND must be redis or filesystem, not {SQLLAB_RESULTS_BACKEND}"
+    )
+# Arrow tables in MessagePack, zlib-compressed, rather than JSON
+RESULTS_BACKEND_USE_MSGPACK = True
 
-CACHE_CONFIG = {
-    "CACHE_TYPE": "RedisCache",
-    "CACHE_DEFAULT_TIMEOUT": 300,
-    "CACHE_KEY_PREFIX": "superset_",
+# Each cache has its own Redis DB, timeout and entry size limit (see
+# caches.py), and chart data and thumbnails are on REDIS_DATA_HOST, so large
+# chart results can't crowd out the rest. Datasets
+# override the chart data timeout with their cache_timeout, e.g. 60s for the
+# tweets and netflow tables that change constantly.
+REDIS_CACHE = {
+    "CACHE_TYPE": "caches.LimitedRedisCache",
     "CACHE_REDIS_HOST": REDIS_HOST,
     "CACHE_REDIS_PORT": REDIS_PORT,
-    "CACHE_REDIS_DB": REDIS_RESULTS_DB,
 }
-DATA_CACHE_CONFIG = CACHE_CONFIG
+REDIS_DATA_CACHE = {
+    **REDIS_CACHE,
+    "CACHE_REDIS_HOST": REDIS_DATA_HOST,
+    "CACHE_REDIS_PORT": REDIS_DATA_PORT,
+}
+
+# Superset objects and database metadata (schema and table lists)
+CACHE_CONFIG = {
+    **REDIS_CACHE,
+    "CACHE_DEFAULT_TIMEOUT": 3600,
+    "CACHE_KEY_PREFIX": "superset_",
+    "CACHE_REDIS_DB": REDIS_CACHE_DB,
+    "CACHE_OPTIONS": {"max_entry_bytes": 16 * 1024 * 1024},
+}
+
+# Chart query results
+DATA_CACHE_CONFIG = {
+    **REDIS_DATA_CACHE,
+    "CACHE_DEFAULT_TIMEOUT": 300,
+    "CACHE_KEY_PREFIX": "superset_data_",
+    "CACHE_REDIS_DB": REDIS_DATA_CACHE_DB,
+    "CACHE_OPTIONS": {"max_entry_bytes": 32 * 1024 * 1024},
+}
+
+# Dashboard filter state and unsaved explore state. Entries are kept while in
+# use; Superset's defaults keep them in the metadata database instead.
+FILTER_STATE_CACHE_CONFIG = {
+    **REDIS_CACHE,
+    "CACHE_DEFAULT_TIMEOUT": int(timedelta(days=90).total_seconds()),
+    "REFRESH_TIMEOUT_ON_RETRIEVAL": True,
+    "CACHE_KEY_PREFIX": "superset_filter_state_",
+    "CACHE_REDIS_DB": REDIS_STATE_CACHE_DB,
+    "CACHE_OPTIONS": {"max_entry_bytes": 8 * 1024 * 1024},
+}
+EXPLORE_FORM_DATA_CACHE_CONFIG = {
+    **FILTER_STATE_CACHE_CONFIG,
+    "CACHE_DEFAULT_TIMEOUT": int(timedelta(days=7).total_seconds()),
+    "CACHE_KEY_PREFIX": "superset_explore_form_data_",
+}
+
+# Dashboard and chart thumbnails, when the THUMBNAILS feature is enabled
+THUMBNAIL_CACHE_CONFIG = {
+    **REDIS_DATA_CACHE,
+    "CACHE_DEFAULT_TIMEOUT": int(timedelta(days=7).total_seconds()),
+    "CACHE_KEY_PREFIX": "superset_thumbnail_",
+    "CACHE_REDIS_DB": REDIS_THUMBNAIL_CACHE_DB,
+    "CACHE_OPTIONS": {"max_entry_bytes": 8 * 1024 * 1024},
+}
 
 
 class CeleryConfig:
@@ -79,6 +157,7 @@ class CeleryConfig:
         "superset.tasks.scheduler",
         "superset.tasks.thumbnails",
         "superset.tasks.cache",
+        "rollups",
     )
     result_backend = f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_RESULTS_DB}"
     worker_prefetch_multiplier = 1
@@ -92,6 +171,29 @@ class CeleryConfig:
             "task": "reports.prune_log",
             "schedule": crontab(minute=10, hour=0),
         },
+        # Rollup tables behind the time series charts (see rollups.py). Each
+        # refresh re-runs the charts on the table, and the rollup datasets'
+        # cache_timeout is a little longer than the interval, so their cached
+        # results are replaced before they expire. A run still queued at the
+        # next one is dropped.
+        "rollups.netflow_per_minute": {
+            "task": "rollups.refresh",
+            "schedule": crontab(minute="*", hour="*"),
+            "args": ("netflow_per_minute",),
+            "options": {"expires": 60},
+        },
+        "rollups.waterlevel_per_hour": {
+            "task": "rollups.refresh",
+            "schedule": crontab(minute=5, hour="*"),
+            "args": ("waterlevel_per_hour",),
+            "options": {"expires": 3600},
+        },
+        "rollups.fraud_trades_per_day": {
+            "task": "rollups.refresh",
+            "schedule": crontab(minute=15, hour="*"),
+            "args": ("fraud_trades_per_day",),
+            "options": {"expires": 3600},
+        },
     }
 
 
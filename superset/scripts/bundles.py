@@ -0,0 +1,176 @@
+"""
+Build Superset asset bundles from templates/ in memory.
+
+Each directory under templates/ is one bundle. Its YAML files use the
+gomplate expression
+
+    {{ env.Getenv "NAME" | required "message" }}
+
+(optionally with a default, `env.Getenv "NAME" "default"`), which is
+rendered from the environment; any other template expression is an error
+rather than being passed through. A bundle is zipped in memory, as
+`zip -r <bundle>.zip <bundle>` would, with fixed timestamps.
+
+Rendered bundles are cached by a fingerprint of their template files and
+the values of the variables they use, so a bundle is only rendered when
+it is needed and its fingerprint alone tells whether it changed.
+
+To write the zip files for inspection:
+
+    python3 bundles.py --templates ../templates --output ../generated
+"""
+import os
+import io
+import re
+import sys
+import hashlib
+import zipfile
+import argparse
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+# Timestamp of every zip entry, so identical content gives identical bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+EXPRESSION = re.compile(r'\{\{(.*?)\}\}', re.DOTALL)
+GETENV = re.compile(
+    r'\s*env\.Getenv\s+"(?P<name>[^"]+)"(?:\s+"(?P<default>[^"]*)")?'
+    r'(?P<required>\s*\|\s*required(?:\s+"(?P<message>[^"]*)")?)?\s*$'
+)
+
+class TemplateError(Exception):
+    """A template uses an unsupported expression or a required variable is not set."""
+
+def template_variables(text):
+    """Names of the environment variables a template uses."""
+    names = set()
+    for expression in EXPRESSION.finditer(text):
+        match = GETENV.match(expression.group(1))
+        if match:
+            names.add(match.group('name'))
+    return names
+
+def render_template(text, env, source="template"):
+    """
+    Fill in the env.Getenv expressions of a template.
+
+    Args:
+        text (str): the template
+        env (dict): variables, e.g. os.environ
+        source (str): name of the template for error messages
+
+    Raises:
+        TemplateError: for unsupported expressions and unset required
+            variables
+    """
+    def replace(expression):
+        match = GETENV.match(expression.group(1))
+        if not match:
+            raise TemplateError(f"{source}: unsupported template expression {expression.group(0)}")
+        value = env.get(match.group('name'))
+        if not value:
+            if match.group('default') is not None:
+                return match.group('default')
+            if match.group('required'):
+                raise TemplateError(f"{source}: {match.group('message') or match.group('name') + ' is required'}")
+            return ''
+        return value
+    return EXPRESSION.sub(replace, text)
+
+class BundleBuilder:
+    """
+    Renders and zips the bundles under a templates directory.
+
+    Args:
+        template_dir (str): directory with one subdirectory per bundle
+        env (dict): variables for the templates, defaults to os.environ
+    """
+    def __init__(self, template_dir=TEMPLATE_DIR, env=None):
+        self.template_dir = template_dir
+        self.env = dict(os.environ if env is None else env)
+        self.templates = {}
+        self.cache = {}
+
+    def bundle_names(self):
+        return sorted(name for name in os.listdir(self.template_dir)
+                      if os.path.isdir(os.path.join(self.template_dir, name)))
+
+    def _templates(self, name):
+        """The (path in bundle, text) of the files of a bundle, read once."""
+        if name not in self.templates:
+            bundle_dir = os.path.join(self.template_dir, name)
+            if not os.path.isdir(bundle_dir):
+                raise FileNotFoundError(f"No templates for bundle {name} in {self.template_dir}")
+            files = []
+            for root, dirs, filenames in os.walk(bundle_dir):
+                dirs.sort()
+                for filename in sorted(filenames):
+                    path = os.path.join(root, filename)
+                    with open(path, "r", encoding="utf-8") as f:
+                        files.append((os.path.relpath(path, self.template_dir).replace(os.sep, '/'), f.read()))
+            self.templates[name] = files
+        return self.templates[name]
+
+    def fingerprint(self, name):
+        """Hash of a bundle's templates and the values of the variables they use."""
+        digest = hashlib.sha256()
+        names = set()
+        for path, text in self._templates(name):
+            digest.update(path.encode() + b"\0" + text.encode() + b"\0")
+            names |= template_variables(text)
+        for variable in sorted(names):
+            digest.update(f"{variable}={self.env.get(variable, '')}\0".encode())
+        return digest.hexdigest()
+
+    def render(self, name):
+        """
+        Render the files of a bundle.
+
+        Returns:
+            list[tuple]: (path in bundle, rendered text)
+
+        Raises:
+            TemplateError: if a template can't be rendered
+        """
+        return [(path, render_template(text, self.env, path)) for path, text in self._templates(name)]
+
+    def build(self, name):
+        """
+        Render a bundle and zip it in memory.
+
+        Returns:
+            (bytes): the zip file
+
+        Raises:
+            TemplateError: if a template can't be rendered
+        """
+        key = self.fingerprint(name)
+        if key not in self.cache:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as bundle:
+                for path, text in self.render(name):
+                    info = zipfile.ZipInfo(path, date_time=ZIP_DATE_TIME)
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.external_attr = 0o644 << 16
+                    bundle.writestr(info, text)
+            self.cache[key] = buffer.getvalue()
+        return self.cache[key]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the Superset asset templates into zip bundles.")
+    parser.add_argument("--templates", default=TEMPLATE_DIR, help="Templates directory (default: ../templates)")
+    parser.add_argument("--output", required=True, help="Directory to write <bundle>.zip files into")
+    parser.add_argument("bundles", nargs="*", help="Bundles to build (default: all)")
+    args = parser.parse_args()
+
+    builder = BundleBuilder(args.templates)
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        for name in args.bundles or builder.bundle_names():
+            path = os.path.join(args.output, f"{name}.zip")
+            with open(path, "wb") as f:
+                f.write(builder.build(name))
+            print(f"Built {path}")
+    except (TemplateError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -1,11 +1,36 @@
 import os
+import sys
+import json
+import time
 import argparse
+import yaml  # installed with superset-api-client
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from supersetapiclient.client import SupersetClient
 
+from bundles import TEMPLATE_DIR, BundleBuilder
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Fingerprints of the bundles last imported, kept outside the templates
+STATE_FILE = os.path.join(os.path.dirname(SCRIPT_DIR), "generated", ".import_state.json")
+
+# Bundles uploaded at once; Superset imports each in its own request
+IMPORT_WORKERS = 4
+
 def parse_arguments():
     """Parse command-line arguments."""
-    parser = argparse.ArgumentParser(description="Database connection manager.")
+    parser = argparse.ArgumentParser(description="Build the Superset asset bundles from templates and import them.")
     parser.add_argument("--overwrite", action="store_true", help="Overwrite existing assets")
+    parser.add_argument("--manifest", default=os.path.join(SCRIPT_DIR, "assets.json"),
+                        help="Bundles to import and their dependencies (default: assets.json next to this script)")
+    parser.add_argument("--templates", default=TEMPLATE_DIR,
+                        help="Directory with a template directory per bundle (default: ../templates)")
+    parser.add_argument("--state", default=STATE_FILE,
+                        help="Where the fingerprints of imported bundles are kept (default: ../generated/.import_state.json)")
+    parser.add_argument("--force", action="store_true",
+                        help="Import every bundle, even if it is unchanged since the last import")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS,
+                        help=f"Bundles uploaded at once (default: {IMPORT_WORKERS})")
     return parser.parse_args()
 
 def set_environment():
@@ -29,20 +54,216 @@ def initialize_client(docker_host):
     print("Connected to Superset.")
     return client
 
-def upload_file(client, docker_host, file_path, endpoint):
-    """Upload a file to the specified Superset API endpoint."""
-    with open(file_path, "rb") as file:
-        files = {
-            "formData": (os.path.basename(file_path), file, "application/zip")
-        }
-        url = f"http://{docker_host}:8088{endpoint}"
-        response = client.session.post(url, data=data, files=files)
+def load_manifest(path):
+    """
+    Load the asset manifest: a JSON list of bundles, each with the 'bundle'
+    name (the zip file without .zip), the asset 'type' ('dataset',
+    'dashboard' or 'saved_query', which selects the import endpoint) and
+    optionally 'depends_on', bundles that must be imported first.
+
+    Returns:
+        list[dict]: the bundles, in manifest order
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        bundles = json.load(f)
+    names = {b['bundle'] for b in bundles}
+    for bundle in bundles:
+        assert bundle['type'] in ('dataset', 'dashboard', 'saved_query'), \
+            f"Unknown asset type {bundle['type']} for {bundle['bundle']} in {path}"
+        unknown = set(bundle.get('depends_on', [])) - names
+        assert not unknown, f"{bundle['bundle']} depends on {', '.join(unknown)}, which are not in {path}"
+    return bundles
+
+def load_state(path, docker_host):
+    """Fingerprints of the bundles last imported into the Superset at `docker_host`."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(docker_host, {})
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, docker_host, imported):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state[docker_host] = imported
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=4)
+    os.replace(f"{path}.tmp", path)
+
+class AssetsExistError(RuntimeError):
+    """Superset refused an import without overwrite because its assets already exist."""
+
+# How Superset describes an asset that exists when overwrite isn't set
+EXISTS_MESSAGE = "already exists and `overwrite=true` was not passed"
+
+def assets_exist(response):
+    """True if every error of a rejected import is an asset that already exists."""
+    try:
+        errors = response.json()["errors"]
+    except (ValueError, KeyError, TypeError):
+        return False
+    messages = [
+        message
+        for error in errors
+        for key, message in (error.get("extra") or {}).items()
+        if key != "issue_codes"
+    ]
+    return bool(messages) and all(EXISTS_MESSAGE in str(message) for message in messages)
+
+def upload_file(client, docker_host, file_name, content, endpoint, data):
+    """
+    Upload a zip file held in memory to the specified Superset API endpoint.
+
+    Raises:
+        AssetsExistError: if the assets already exist and overwrite isn't set
+        RuntimeError: if Superset rejects the import
+    """
+    files = {
+        "formData": (file_name, content, "application/zip")
+    }
+    url = f"http://{docker_host}:8088{endpoint}"
+    response = client.session.post(url, data=data, files=files)
+
+    if response.status_code == 422 and assets_exist(response):
+        raise AssetsExistError(f"Error {response.status_code}: {response.text}")
+    if response.status_code != 200:
+        raise RuntimeError(f"Error {response.status_code}: {response.text}")
+    return response.text
+
+def rison_string(value):
+    return "'" + value.replace("!", "!!").replace("'", "!'") + "'"
+
+def restore_query_contexts(client, docker_host, files):
+    """
+    Save the query context of each chart in a dashboard bundle, which
+    Superset drops on import, so the charts can be warmed up from the
+    worker (see docker/pythonpath_dev/rollups.py). Charts are found by
+    name and the query context is pointed at the chart's dataset.
+
+    Args:
+        files (list[tuple]): the rendered bundle, from BundleBuilder.render
+
+    Raises:
+        RuntimeError: if Superset rejects an update
+    """
+    url = f"http://{docker_host}:8088/api/v1/chart/"
+    for path, text in files:
+        if '/charts/' not in path:
+            continue
+        chart = yaml.safe_load(text)
+        if not chart.get('query_context'):
+            continue
+        q = f"(columns:!(id,datasource_id),filters:!((col:slice_name,opr:eq,value:{rison_string(chart['slice_name'])})))"
+        response = client.session.get(url, params={"q": q})
+        if response.status_code != 200:
+            raise RuntimeError(f"Error {response.status_code}: {response.text}")
+        found = response.json()['result']
+        if len(found) != 1:
+            print(f"Query context of chart {chart['slice_name']} not restored: {len(found)} charts have that name")
+            continue
+
+        query_context = json.loads(chart['query_context'])
+        query_context['datasource']['id'] = found[0]['datasource_id']
+        query_context['form_data']['datasource'] = f"{found[0]['datasource_id']}__table"
+        response = client.session.put(f"{url}{found[0]['id']}", json={
+            "query_context": json.dumps(query_context),
+            "query_context_generation": True,
+        })
+        if response.status_code != 200:
+            raise RuntimeError(f"Error {response.status_code}: {response.text}")
+
+def import_bundles(client, docker_host, bundles, builder, state_path, data, force=False, max_workers=IMPORT_WORKERS):
+    """
+    Import the bundles whose fingerprint differs from the last import,
+    concurrently, starting each once the bundles it depends on have been
+    imported or found unchanged. Bundles are rendered by `builder` (a
+    BundleBuilder) in the upload threads; unchanged ones are never
+    rendered. The query contexts of imported dashboards' charts are
+    restored afterwards.
+
+    Without overwrite in `data`, a bundle whose assets all exist already,
+    e.g. on a stack set up before fingerprints were kept, is left as it is
+    ('kept'). Its fingerprint is not recorded, so a later run with
+    overwrite replaces it.
+
+    Returns:
+        (bool): True if every bundle was imported, unchanged or kept
+    """
+    start = time.monotonic()
+    imported = load_state(state_path, docker_host)
+    results = {}
+
+    pending = {}
+    for bundle in bundles:
+        name = bundle['bundle']
+        try:
+            fingerprint = builder.fingerprint(name)
+        except OSError as e:
+            print(f"Failed {name}: {e}")
+            results[name] = 'failed'
+            continue
+        if not force and imported.get(name) == fingerprint:
+            print(f"Unchanged {name}")
+            results[name] = 'unchanged'
+            continue
+        pending[name] = dict(bundle, fingerprint=fingerprint)
+
+    def upload(bundle):
+        upload_start = time.monotonic()
+        content = builder.build(bundle['bundle'])
+        upload_file(client, docker_host, f"{bundle['bundle']}.zip", content, f"/api/v1/{bundle['type']}/import/", data)
+        if bundle['type'] == 'dashboard':
+            restore_query_contexts(client, docker_host, builder.render(bundle['bundle']))
+        return time.monotonic() - upload_start
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            for name, bundle in list(pending.items()):
+                states = [results.get(dep) for dep in bundle.get('depends_on', [])]
+                if any(s in ('failed', 'blocked') for s in states):
+                    print(f"Skipped {name}: a bundle it depends on failed")
+                    results[name] = 'blocked'
+                    del pending[name]
+                elif all(s in ('imported', 'unchanged', 'kept') for s in states):
+                    running[pool.submit(upload, bundle)] = bundle
+                    del pending[name]
+            if not running:
+                # Whatever is still pending depends on bundles missing from this run
+                for name in pending:
+                    print(f"Skipped {name}: a bundle it depends on was not imported")
+                    results[name] = 'blocked'
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                bundle = running.pop(future)
+                name = bundle['bundle']
+                try:
+                    elapsed = future.result()
+                except AssetsExistError:
+                    print(f"Kept {name}: its assets already exist, pass --overwrite to replace them")
+                    results[name] = 'kept'
+                    continue
+                except Exception as e:
+                    print(f"Failed {name}: {e}")
+                    results[name] = 'failed'
+                    imported.pop(name, None)
+                    continue
+                print(f"Imported {name} in {elapsed:.1f}s")
+                results[name] = 'imported'
+                imported[name] = bundle['fingerprint']
+                save_state(state_path, docker_host, imported)
 
-    # Print the response
-    if response.status_code == 200:
-        print(f"Upload successful for {file_path}: {response.text}")
-    else:
-        print(f"Error {response.status_code} for {file_path}: {response.text}")
+    counts = {s: list(results.values()).count(s) for s in ('imported', 'unchanged', 'kept', 'failed', 'blocked')}
+    print(f"Asset import finished in {time.monotonic() - start:.1f}s: {counts['imported']} imported, "
+          f"{counts['unchanged']} unchanged, {counts['kept']} kept, {counts['failed']} failed, "
+          f"{counts['blocked']} skipped")
+    return not counts['failed'] and not counts['blocked']
 
 if __name__ == "__main__":
     args = parse_arguments()
@@ -50,6 +271,7 @@ if __name__ == "__main__":
 
     try:
         docker_host = get_docker_host()
+        bundles = load_manifest(args.manifest)
         client = initialize_client(docker_host)
 
         data = {
@@ -60,19 +282,14 @@ if __name__ == "__main__":
             "ssh_tunnel_private_key_passwords": "{}",  # Empty JSON map
         }
 
-        upload_file(client, docker_host, '/generated/dataset_export_tweets.zip', '/api/v1/dataset/import/')
-        upload_file(client, docker_host, '/generated/dashboard_export_tweets.zip', '/api/v1/dashboard/import/')
-        upload_file(client, docker_host, '/generated/dashboard_export_netflow.zip', '/api/v1/dashboard/import/')
-        upload_file(client, docker_host, '/generated/dashboard_export_waterlevel.zip', '/api/v1/dashboard/import/')
-        upload_file(client, docker_host, '/generated/dashboard_export_fraud.zip', '/api/v1/dashboard/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_catalog.zip', '/api/v1/saved_query/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_auditlog.zip', '/api/v1/saved_query/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_latest_tweets.zip', '/api/v1/saved_query/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_tweets_in_iceberg.zip', '/api/v1/saved_query/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_copy_tweets.zip', '/api/v1/saved_query/import/')
-        upload_file(client, docker_host, '/generated/saved_query_export_netflow.zip', '/api/v1/saved_query/import/')
+        builder = BundleBuilder(args.templates)
+        if not import_bundles(client, docker_host, bundles, builder, args.state, data,
+                              args.force, args.workers):
+            sys.exit(1)
 
     except EnvironmentError as e:
         print(f"Environment setup error: {e}")
+        sys.exit(1)
     except Exception as e:
         print(f"Unexpected error: {e}")
+        sys.exit(1)
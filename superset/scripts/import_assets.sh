@@ -12,28 +12,27 @@ cd "$script_dir"
 # Load environment variables
 source "$parent_dir/../.env-local"
 
-# Container configuration
-CONTAINER_NAME="hairyhenderson/gomplate:latest"
 HOST_WORKDIR="$parent_dir"
-INPUT_DIR="$HOST_WORKDIR/templates"
 OUTPUT_DIR="$HOST_WORKDIR/generated"
 
-# Clean up previous assets
-cleanup_assets() {
-  docker run --rm \
-    -v "$OUTPUT_DIR:/workspace/output" \
-    --name superset_generated_cleanup \
-    python:3.10-slim \
-    sh -xc "find /workspace/output -mindepth 1 ! -name '.gitignore' -exec rm -rf {} +"
+# Render the templates into bundles in memory and import them into Superset.
+# generated/ only keeps the fingerprints of the imported bundles.
+import_assets() {
+  IMAGE_NAME="python:3.10-slim"
+  CONTAINER_NAME="import_superset_assets"
 
-  find $OUTPUT_DIR
-}
+  IMPORT_FLAGS=""
+  for arg in "$@"; do
+    case "$arg" in
+      --overwrite) IMPORT_FLAGS="$IMPORT_FLAGS --overwrite" ;;
+      # Import every bundle, even those unchanged since the last import
+      --reimport) IMPORT_FLAGS="$IMPORT_FLAGS --force" ;;
+    esac
+  done
 
-# Generate assets using gomplate
-generate_assets() {
   docker run --rm \
-    -v "$INPUT_DIR:/workspace/input" \
-    -v "$OUTPUT_DIR:/workspace/output" \
+    --name "$CONTAINER_NAME" \
+    --network host \
     -e "DOCKER_HOST_OR_IP=$DOCKER_HOST_OR_IP" \
     -e "S3A_ACCESS_KEY=$S3A_ACCESS_KEY" \
     -e "S3A_SECRET_KEY=$S3A_SECRET_KEY" \
@@ -59,54 +58,14 @@ generate_assets() {
     -e "VASTDB_WATERLEVEL_BUCKET=$VASTDB_WATERLEVEL_BUCKET" \
     -e "VASTDB_WATERLEVEL_SCHEMA=$VASTDB_WATERLEVEL_SCHEMA" \
     -e "VASTDB_DATA_ENDPOINTS=$VASTDB_DATA_ENDPOINTS" \
-    -w /workspace \
-    "$CONTAINER_NAME" \
-    --input-dir /workspace/input \
-    --output-dir /workspace/output
-}
-
-# Compress directories into zip files
-compress_directories() {
-  cd "$script_dir/../generated"
-
-  docker run --rm \
-    -v "$(pwd):/data" debian:stable-slim \
-    sh -c "\
-      apt-get update && \
-      apt-get install -y zip && \
-      cd /data && \
-      for dir in *; do \
-        if [ -d \"\$dir\" ]; then \
-          zip -r \"\$dir.zip\" \"\$dir\"; \
-        fi; \
-      done"
-  
-  cd "$script_dir"
-}
-
-# Import assets into Superset
-import_assets() {
-  IMAGE_NAME="python:3.10-slim"
-  CONTAINER_NAME="import_superset_assets"
-
-  OVERWRITE_FLAG=""
-  if [[ "$1" == "--overwrite" ]]; then
-    OVERWRITE_FLAG="--overwrite"
-  fi
-
-  docker run --rm \
-    --name "$CONTAINER_NAME" \
-    --network host \
-    -e DOCKER_HOST_OR_IP="$DOCKER_HOST_OR_IP" \
     -v "$script_dir/../scripts/:/scripts" \
-    -v "$script_dir/../generated/:/generated" \
+    -v "$script_dir/../templates/:/templates:ro" \
+    -v "$OUTPUT_DIR/:/generated" \
     "$IMAGE_NAME" /bin/bash -c "\
       pip install --no-cache-dir --no-warn-script-location --disable-pip-version-check --quiet superset-api-client && \
-      python /scripts/import_assets.py $OVERWRITE_FLAG"
+      python /scripts/import_assets.py$IMPORT_FLAGS"
 }
 
 # Execute tasks
-cleanup_assets
-generate_assets
-compress_directories
-import_assets "$1"
+mkdir -p "$OUTPUT_DIR"
+import_assets "$@"